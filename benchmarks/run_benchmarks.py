@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import gdal
+import numpy as np
+import pandas as pd
+
+import utils.dem_utils as dem_utils
+from benchmarks.synthetic_data import generate_dataset
+from benchmarks.tile_server import TileServer
+from flood_severity_estimation import compute_features, get_values
+from utils.dataset_utils import round_coordinates
+from utils.dem_utils import configure_downloads, make_request_dsm, fetch_mosaic_tiles, merge_dsm, fill_no_data, \
+    upsample_dsm, set_tile_cache
+from utils.tile_cache import TileCache
+from utils.vsimem_utils import vsimem_namespace
+
+TILES = [("N048", "E011"), ("N048", "E012"), ("N047", "E011"), ("N047", "E012"), ("N049", "E011"),
+         ("N049", "E012"), ("N048", "E010"), ("N047", "E010"), ("N049", "E010"), ("N048", "E013"),
+         ("N047", "E013"), ("N049", "E013")]
+MISSING_TILES = [("N049", "E013")]
+
+
+def generate_photos(count, seed=0):
+    random_state = np.random.RandomState(seed)
+    longitudes = random_state.uniform(10.0, 13.0, count)
+    latitudes = random_state.uniform(47.0, 49.0, count)
+
+    # A share of the photos sits right next to a tile edge, where neighbor tiles and nodata filling matter.
+    edges = random_state.rand(count) < 0.2
+    longitudes[edges] = np.round(longitudes[edges]) + random_state.uniform(-0.001, 0.001, edges.sum())
+
+    rows = []
+    for index, (longitude, latitude) in enumerate(zip(longitudes, latitudes)):
+        longitude_converted, latitude_converted = round_coordinates(longitude, latitude)
+        rows.append({'filename': index, 'class': 1, 'longitude': longitude, 'latitude': latitude,
+                     'longitude_converted': longitude_converted, 'latitude_converted': latitude_converted})
+    return pd.DataFrame(rows)
+
+
+def configure(server_url, srtm_path, eu_dem_path, tile_cache_directory):
+    gdal.UseExceptions()
+    configure_downloads(url=server_url)
+    set_tile_cache(TileCache(tile_cache_directory))
+    dem_utils.SRTM_PATH = srtm_path
+    dem_utils.EU_DEM_PATH = eu_dem_path
+
+
+def time_stage(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def benchmark_stages(settings, repeat):
+    row = generate_photos(1).iloc[0]
+    timings = {}
+
+    with tempfile.TemporaryDirectory() as directory, vsimem_namespace() as prefix:
+        configure(*settings, directory)
+        timings['make_request_dsm'] = time_stage(
+            lambda: make_request_dsm(row['latitude_converted'], row['longitude_converted']).content, repeat)
+
+        # The tiles come from the local cache from here on, so the stages below do not include any download.
+        dsm_content, neighbors = fetch_mosaic_tiles(row, prefix)
+        timings['merge_dsm'] = time_stage(lambda: merge_dsm(row, dsm_content, prefix + "/dsm_merged", neighbors),
+                                          repeat)
+        merged = merge_dsm(row, dsm_content, prefix + "/dsm_merged", neighbors)
+        timings['fill_no_data'] = time_stage(lambda: fill_no_data(merged, prefix + "/dsm_final"), repeat)
+        filled = fill_no_data(merged, prefix + "/dsm_final")
+        timings['upsample'] = time_stage(lambda: upsample_dsm(filled, prefix + "/dsm_high_res"), repeat)
+        high_res = upsample_dsm(filled, prefix + "/dsm_high_res")
+        timings['neighborhood_statistics'] = time_stage(lambda: compute_features([row], high_res), repeat)
+
+    return timings
+
+
+def benchmark_get_values(settings, count, options):
+    data_frame = generate_photos(count, seed=count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(*settings, os.path.join(directory, "tiles"))
+        start = time.perf_counter()
+        get_values(data_frame, font="benchmark", output_name=os.path.join(directory, "values.csv"), **options)
+        elapsed = time.perf_counter() - start
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {'photos': count, 'seconds': elapsed, 'photos_per_second': count / elapsed, 'peak_rss_mb': peak_rss}
+
+
+def run_isolated(function, *args):
+    # Every measurement runs in a fresh process so the peak RSS belongs to that measurement only.
+    with ProcessPoolExecutor(1) as executor:
+        return executor.submit(function, *args).result()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the flood severity estimation pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000],
+                        help="number of photos of each end-to-end run")
+    parser.add_argument("--tile-size", type=int, default=3600, help="pixels per side of the synthetic tiles")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of each stage timing")
+    parser.add_argument("--batch", action="store_true", help="run get_values in batch mode")
+    parser.add_argument("--local-upsample", action="store_true", help="run get_values with local upsampling")
+    parser.add_argument("--output", help="write the results to a JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    options = {'batch': args.batch, 'local_upsample': args.local_upsample}
+
+    with tempfile.TemporaryDirectory() as directory:
+        tiles_directory, srtm_path, eu_dem_path = generate_dataset(directory, TILES, MISSING_TILES, args.tile_size)
+
+        with TileServer(tiles_directory) as server:
+            settings = (server.url, srtm_path, eu_dem_path)
+            results = {'stages': run_isolated(benchmark_stages, settings, args.repeat),
+                       'get_values': [run_isolated(benchmark_get_values, settings, count, options)
+                                      for count in args.sizes]}
+
+    for stage, seconds in results['stages'].items():
+        print("{:<25}: {:9.2f} ms".format(stage, 1000 * seconds))
+    for result in results['get_values']:
+        print("get_values {photos:>7} photos: {seconds:8.2f} s, {photos_per_second:8.2f} photos/s, "
+              "peak RSS {peak_rss_mb:8.1f} MB".format(**result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import os
+
+import gdal
+import numpy as np
+import osr
+
+from utils.dem_utils import get_tile_origin
+
+
+def get_tile_directory(latitude):
+    if latitude[0] == "N":
+        return os.path.join("North", "North_0_45" if int(latitude[1:]) <= 45 else "North_46_90")
+    return "South"
+
+
+def generate_elevation(x_origin, y_origin, size, pixel_size, seed):
+    rows, cols = np.mgrid[0:size, 0:size]
+    longitudes = x_origin + (cols + 0.5) * pixel_size
+    latitudes = y_origin - (rows + 0.5) * pixel_size
+
+    # Smooth terrain that is continuous across tiles, plus per-tile noise for buildings and vegetation.
+    terrain = 300 + 120 * np.sin(longitudes * 7) * np.cos(latitudes * 5) + 40 * np.sin(latitudes * 31)
+    noise = np.random.RandomState(seed).normal(0, 2, size=(size, size))
+    return terrain + noise
+
+
+def write_geotiff(path, data, x_origin, y_origin, pixel_size, data_type, no_data_value=-9999):
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+
+    driver = gdal.GetDriverByName('GTiff')
+    dataset = driver.Create(path, data.shape[1], data.shape[0], 1, data_type, options=["COMPRESS=DEFLATE", "TILED=YES"])
+    dataset.SetGeoTransform((x_origin, pixel_size, 0, y_origin, 0, -pixel_size))
+    dataset.SetProjection(srs.ExportToWkt())
+
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(no_data_value)
+    band.WriteArray(data)
+    dataset.FlushCache()
+
+
+def generate_tile(directory, latitude, longitude, size=3600, holes=0, seed=0):
+    x_origin, y_origin = get_tile_origin(latitude, longitude)
+    data = generate_elevation(x_origin, y_origin, size, 1 / size, seed).astype(np.int16)
+
+    random_state = np.random.RandomState(seed + 1)
+    for _ in range(holes):
+        row, col = random_state.randint(0, size, 2)
+        radius = random_state.randint(size // 200 + 1, size // 20 + 2)
+        data[max(row - radius, 0):row + radius, max(col - radius, 0):col + radius] = -9999
+
+    tile_directory = os.path.join(directory, get_tile_directory(latitude))
+    os.makedirs(tile_directory, exist_ok=True)
+
+    path = os.path.join(tile_directory, "{}{}_AVE_DSM.tif".format(latitude, longitude))
+    write_geotiff(path, data, x_origin, y_origin, 1 / size, gdal.GDT_Int16)
+    return path
+
+
+def generate_fallback_dem(path, bounds, pixel_size, seed):
+    west, south, east, north = bounds
+    cols, rows = int(round((east - west) / pixel_size)), int(round((north - south) / pixel_size))
+
+    data = generate_elevation(west, north, max(rows, cols), pixel_size, seed)[:rows, :cols].astype(np.float32)
+    write_geotiff(path, data, west, north, pixel_size, gdal.GDT_Float32)
+    return path
+
+
+def generate_dataset(directory, tiles, missing_tiles=(), size=3600, holes=2, srtm_pixel_size=1 / 120,
+                     eu_dem_pixel_size=1 / 1200):
+    for index, (latitude, longitude) in enumerate(tiles):
+        if (latitude, longitude) not in missing_tiles:
+            generate_tile(os.path.join(directory, "tiles"), latitude, longitude, size, holes, seed=index)
+
+    origins = [get_tile_origin(latitude, longitude) for latitude, longitude in tiles]
+    bounds = (min(x for x, _ in origins) - 1, min(y for _, y in origins) - 2,
+              max(x for x, _ in origins) + 2, max(y for _, y in origins) + 1)
+
+    os.makedirs(os.path.join(directory, "dems"), exist_ok=True)
+    srtm_path = generate_fallback_dem(os.path.join(directory, "dems", "srtm30_merged.tif"), bounds,
+                                      srtm_pixel_size, seed=1000)
+    eu_dem_path = generate_fallback_dem(os.path.join(directory, "dems", "eu_dem.tif"), bounds,
+                                        eu_dem_pixel_size, seed=2000)
+
+    return os.path.join(directory, "tiles"), srtm_path, eu_dem_path
@@ -0,0 +1,99 @@
+import argparse
+import os
+
+from utils.cli_utils import add_dataset_arguments, add_tile_arguments, add_estimation_arguments
+
+
+def import_estimation():
+    # GDAL and the estimation pipeline are only imported by the commands that fetch tiles or estimate.
+    import gdal
+    import flood_severity_estimation
+
+    gdal.UseExceptions()
+    return flood_severity_estimation
+
+
+def load(args):
+    from utils.dataset_utils import DATASETS, load_dataset
+
+    for font, _ in DATASETS:
+        print("{:<25}: {:>6d} photos".format(font, load_dataset(font, args.metadata_cache).shape[0]))
+
+
+def fetch(args):
+    estimation = import_estimation()
+    estimation.configure_tiles(args)
+    estimation.prefetch_datasets(args, dry_run=args.dry_run)
+
+
+def estimate(args):
+    estimation = import_estimation()
+    estimation.configure_tiles(args)
+    estimation.configure_estimation(args)
+    estimation.estimate_datasets(args)
+    estimation.close_tracer(args)
+
+
+def classify(args):
+    import pandas as pd
+    from utils.dataset_utils import DATASETS, CLASSIFIED_NAME, classify_values
+
+    for _, output_name in DATASETS:
+        if not os.path.isfile(output_name):
+            raise SystemExit("{} does not exist, run the estimate command first.".format(output_name))
+
+    result = classify_values([pd.read_csv(output_name) for _, output_name in DATASETS])
+    print("Classified {} photos into {}.".format(result.shape[0], CLASSIFIED_NAME))
+
+
+def plot(args):
+    import pandas as pd
+    from utils.dataset_utils import CLASSIFIED_NAME
+    from utils.plot_utils import draw_plot
+
+    if not os.path.isfile(CLASSIFIED_NAME):
+        raise SystemExit("{} does not exist, run the classify command first.".format(CLASSIFIED_NAME))
+
+    draw_plot(pd.read_csv(CLASSIFIED_NAME))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Flood Severity Estimation Algorithm, one step at a time")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    load_parser = commands.add_parser("load", help="parse the metadata of the datasets into the metadata cache")
+    load_parser.add_argument("--metadata-cache", default="./cache",
+                             help="directory of the parsed metadata cache")
+    load_parser.set_defaults(function=load)
+
+    fetch_parser = commands.add_parser("fetch", help="download the tiles of the datasets into the tile store or the "
+                                                     "tile cache")
+    add_dataset_arguments(fetch_parser)
+    add_tile_arguments(fetch_parser)
+    fetch_parser.add_argument("--dry-run", action="store_true",
+                              help="only report the number of tiles the datasets need and the bytes to download")
+    fetch_parser.set_defaults(function=fetch)
+
+    estimate_parser = commands.add_parser("estimate", help="compute the values of the photos of the datasets")
+    add_dataset_arguments(estimate_parser)
+    add_tile_arguments(estimate_parser)
+    add_estimation_arguments(estimate_parser)
+    estimate_parser.set_defaults(function=estimate)
+
+    classify_parser = commands.add_parser("classify", help="add the severity classes to the values of the datasets")
+    classify_parser.set_defaults(function=classify)
+
+    plot_parser = commands.add_parser("plot", help="draw the estimated heights of the classified values")
+    plot_parser.set_defaults(function=plot)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    args.function(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,163 +1,710 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
 from pathlib import Path
 
 import gdal
-import numpy as np
 import pandas as pd
-from gdal import gdalconst
 from tqdm import tqdm
 
-from utils.dataset_utils import get_flooded_mediaeval_info, get_flooded_europeanfloods_info, replace_class
-from utils.dem_utils import read_request, make_request_dsm, merge_dsm, fill_no_data, get_geotiff_info, \
-    get_position_in_raster
-from utils.plot_utils import draw_plot
+from utils.cli_utils import add_dataset_arguments, add_tile_arguments, add_estimation_arguments
+from utils.dataset_utils import DATASETS, load_dataset, classify_values, read_photo_stream, geocode_photo
+from utils.dem_utils import open_dsm, merge_dsm, fill_no_data, get_geotiff_metadata, get_position_in_raster, \
+    set_tile_cache, get_tile_cache, set_tile_store, get_tile_store, find_point_quadrant, fetch_mosaic_tiles, \
+    configure_downloads, get_download_options, read_window, get_points_window, clip_dsm, upsample_dsm, \
+    get_dem_version, predict_quadrant, open_fallback_dem, SRTM_PATH, EU_DEM_PATH, get_mosaic_tiles, is_indexed, \
+    set_tile_index, get_tile_index, Position
+from utils.failure_ledger import FailureLedger, start_recording, is_recording, record_failure, \
+    record_duplicate_failure, add_failures, pop_failures, print_failure_summary
+from utils.feature_store import FeatureStore
+from utils.focal_store import FocalStore
+from utils.neighborhood_utils import RADII, compute_neighborhood_features, get_feature_names
+from utils.pipeline_utils import stream
+from utils.prefetch_utils import plan_tiles, prefetch_tiles, print_prefetch_summary
+from utils.plot_utils import draw_plot, compute_height, clamp_height
+from utils.result_utils import ResultWriter
+from utils.shard_utils import parse_shard, select_shard, get_shard_output_name, merge_shard_outputs
+from utils.service_utils import EstimationServer
+from utils.tile_cache import TileCache
+from utils.tile_index import TileIndex
+from utils.tile_store import TileStore
+from utils.trace_utils import Tracer, get_tracer, set_tracer, stage, count, print_summary
+from utils.vsimem_utils import vsimem_namespace, create_namespace, remove_namespace
+
+# Severity classes of the photos, classes 3 and 4 of the annotations are merged into the "more than 1 meter" class.
+SEVERITY_CLASSES = {1: 1, 2: 2, 3: 2}
+
+# Filled mosaics kept per process, keyed by the cached tiles they are built from, so consecutive photos of the same
+# tile and quadrant skip merging and filling.
+FILLED_DSMS_SIZE = 1
+_filled_dsms = OrderedDict()
+
+# Focal-statistics rasters of the tiles already processed in batch mode, None when disabled.
+_focal_store = None
+
+# GDAL datasets and the feature store are shared by the threads of the service, one request is estimated at a time.
+_service_lock = threading.Lock()
+
+
+def build_filled_dsm(rows, dsm_content, prefix, neighbors=None, local_upsample=False):
+    dsm_content = merge_dsm(rows[0], dsm_content, prefix + "/dsm_merged", neighbors)
+
+    if local_upsample:
+        window = get_points_window(dsm_content, [(row['longitude'], row['latitude']) for row in rows])
+        dsm_content = clip_dsm(dsm_content, prefix + "/dsm_clipped", window)
+
+    return fill_no_data(dsm_content, prefix + "/dsm_final")
+
+
+def get_memoized_filled_dsm(rows, dsm_content, neighbors):
+    sources = tuple(neighbors + [dsm_content.GetDescription()])
+    if FILLED_DSMS_SIZE < 1 or any(source.startswith("/vsimem/") for source in sources):
+        return None
+
+    count("filled_dsm_hits" if sources in _filled_dsms else "filled_dsm_misses")
+    if sources not in _filled_dsms:
+        while len(_filled_dsms) >= FILLED_DSMS_SIZE:
+            remove_namespace(_filled_dsms.popitem(last=False)[1][0])
+        prefix = create_namespace()
+        try:
+            _filled_dsms[sources] = prefix, build_filled_dsm(rows, dsm_content, prefix, neighbors)
+        except BaseException:
+            remove_namespace(prefix)
+            raise
+
+    _filled_dsms.move_to_end(sources)
+    return _filled_dsms[sources][1]
+
+
+def build_dsm(rows, dsm_content, prefix, neighbors=None, local_upsample=False):
+    filled_dsm = None
+    if neighbors is not None and not local_upsample:
+        filled_dsm = get_memoized_filled_dsm(rows, dsm_content, neighbors)
+    if filled_dsm is None:
+        filled_dsm = build_filled_dsm(rows, dsm_content, prefix, neighbors, local_upsample)
+
+    return upsample_dsm(filled_dsm, prefix + "/dsm_high_res")
+
+
+def build_indexed_dsm(rows, prefix):
+    # The window around the photos is read from the index across tile boundaries, without building a mosaic.
+    dsm_content = get_tile_index().read(rows, prefix + "/dsm_window")
+    return upsample_dsm(fill_no_data(dsm_content, prefix + "/dsm_final"), prefix + "/dsm_high_res")
+
+
+def compute_features(rows, dsm_content):
+    dsm_info = get_geotiff_metadata(dsm_content)
+    points = [get_position_in_raster(row['longitude'], row['latitude'], dsm_info) for row in rows]
+    with stage("features"):
+        data, points = read_window(dsm_content, points, max(RADII))
+        return compute_neighborhood_features(data, points, RADII, dsm_info[4])
+
+
+def lookup_focal_features(row):
+    if _focal_store is None:
+        return None
+    return _focal_store.lookup(row['latitude_converted'] + row['longitude_converted'], row['longitude'],
+                               row['latitude'])
+
+
+def compute_group_features(rows, dsm_content, clipped=False):
+    if _focal_store is None:
+        return compute_features(rows, dsm_content)
+
+    # The focal rasters cover the photos of the group and their surroundings, any later photo there is a lookup.
+    if not _focal_store.build(rows[0]['latitude_converted'] + rows[0]['longitude_converted'], dsm_content,
+                              [(row['longitude'], row['latitude']) for row in rows], clipped):
+        return compute_features(rows, dsm_content)
+    results = [lookup_focal_features(row) for row in rows]
+    if any(result is None for result in results):
+        computed = iter(compute_features([row for row, result in zip(rows, results) if result is None], dsm_content))
+        results = [next(computed) if result is None else result for result in results]
+    return results
 
 
-def get_8_neighbors_position(current_position):
-    row, col = current_position[0], current_position[1]
-    return [(row - x, col - y) for x in range(-1, 2) for y in range(-1, 2) if x != 0 or y != 0]
+def flood_severity_estimation(row, local_upsample=False):
+    features = lookup_focal_features(row)
+    if features is not None:
+        return features
 
+    with vsimem_namespace() as prefix:
+        if is_indexed(get_mosaic_tiles(row)):
+            return compute_features([row], build_indexed_dsm([row], prefix))[0]
 
-def get_24_neighbors_position(current_position):
-    row, col = current_position[0], current_position[1]
-    return [(row - x, col - y) for x in range(-2, 3) for y in range(-2, 3) if x != 0 or y != 0]
+        dsm_content, neighbors = fetch_mosaic_tiles(row, prefix)
+        dsm_content = build_dsm([row], dsm_content, prefix, neighbors, local_upsample)
+        return compute_features([row], dsm_content)[0]
 
 
-def get_48_neighbors_position(current_position):
-    row, col = current_position[0], current_position[1]
-    return [(row - x, col - y) for x in range(-3, 4) for y in range(-3, 4) if x != 0 or y != 0]
+def estimate_indexed_tile(tile_df):
+    quadrants = OrderedDict()
+    for _, row in tile_df.iterrows():
+        quadrants.setdefault(predict_quadrant(row), []).append(row)
 
+    with vsimem_namespace() as prefix:
+        for rows in quadrants.values():
+            try:
+                results = compute_group_features(rows, build_indexed_dsm(rows, prefix), clipped=True)
+            except (RuntimeError, TypeError) as e:
+                for row in rows:
+                    record_failure(row['filename'], e)
+                results = [None] * len(rows)
+
+            yield from zip(rows, results)
+
+
+def estimate_tile(tile_df, local_upsample=False):
+    if _focal_store is not None:
+        looked_up = []
+        for index, row in tile_df.iterrows():
+            features = lookup_focal_features(row)
+            if features is not None:
+                looked_up.append(index)
+                yield row, features
+
+        tile_df = tile_df.drop(index=looked_up)
+        if tile_df.empty:
+            return
+
+    first_row = tile_df.iloc[0]
+    if is_indexed(get_mosaic_tiles(first_row, list(Position))):
+        yield from estimate_indexed_tile(tile_df)
+        return
+
+    with vsimem_namespace() as prefix:
+        try:
+            dsm_content = open_dsm(first_row['latitude_converted'], first_row['longitude_converted'], prefix + "/dsm")
+            dsm_info = get_geotiff_metadata(dsm_content)
+        except (RuntimeError, TypeError) as e:
+            for _, row in tile_df.iterrows():
+                record_failure(row['filename'], e)
+                yield row, None
+            return
+
+        quadrants = OrderedDict()
+        for _, row in tile_df.iterrows():
+            point = get_position_in_raster(row['longitude'], row['latitude'], dsm_info)
+            quadrants.setdefault(find_point_quadrant(point, dsm_info[-1]), []).append(row)
+
+        for rows in quadrants.values():
+            try:
+                results = compute_group_features(rows, build_dsm(rows, dsm_content, prefix,
+                                                                 local_upsample=local_upsample),
+                                                 clipped=local_upsample)
+            except (RuntimeError, TypeError) as e:
+                for row in rows:
+                    record_failure(row['filename'], e)
+                results = [None] * len(rows)
 
-def get_80_neighbors_position(current_position):
-    row, col = current_position[0], current_position[1]
-    return [(row - x, col - y) for x in range(-4, 5) for y in range(-4, 5) if x != 0 or y != 0]
+            yield from zip(rows, results)
 
 
-def get_120_neighbors_position(current_position):
-    row, col = current_position[0], current_position[1]
-    return [(row - x, col - y) for x in range(-5, 6) for y in range(-5, 6) if x != 0 or y != 0]
+def split_tasks(data_frame, batch):
+    if batch:
+        return [tile_df for _, tile_df in data_frame.groupby(['latitude_converted', 'longitude_converted'], sort=False)]
+    return [data_frame.iloc[[index]] for index in range(data_frame.shape[0])]
 
 
-def get_168_neighbors_position(current_position):
-    row, col = current_position[0], current_position[1]
-    return [(row - x, col - y) for x in range(-6, 7) for y in range(-6, 7) if x != 0 or y != 0]
+def estimate_task(data_frame, batch, local_upsample):
+    start = time.perf_counter()
 
+    if batch:
+        results = list(estimate_tile(data_frame, local_upsample))
+    else:
+        row = data_frame.iloc[0]
+        try:
+            results = [(row, flood_severity_estimation(row, local_upsample))]
+        except (RuntimeError, TypeError) as e:
+            record_failure(row['filename'], e)
+            results = [(row, None)]
 
-def get_differences(current_pos, positions, dsm_info):
-    return [abs(dsm_info[-1][pos[0]][pos[1]] - dsm_info[-1][current_pos[0]][current_pos[1]]) for pos in positions]
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.finish_unit([str(row['filename']) for row, _ in results],
+                           [str(row['filename']) for row, result in results if result is None],
+                           time.perf_counter() - start)
 
+    return results
 
-def fill_result(result, keys, values):
-    result[keys[0]] = np.mean(values)
-    result[keys[1]] = min(values)
-    result[keys[2]] = max(values)
-    return result
 
+def estimate_rows(data_frame, batch, local_upsample=False):
+    for task in split_tasks(data_frame, batch):
+        yield from estimate_task(task, batch, local_upsample)
 
-def flood_severity_estimation(row):
-    result = {}
-    longitude, latitude = row['longitude'], row['latitude']
-    longitude_converted, latitude_converted = row['longitude_converted'], row['latitude_converted']
 
-    dsm_content = read_request(make_request_dsm(latitude_converted, longitude_converted), "/vsimem/dsm")
-    dsm_content = merge_dsm(row, dsm_content, "/vsimem/dsm_merged")
-    dsm_content = fill_no_data(dsm_content, "/vsimem/dsm_final")
+def init_worker(tile_cache, tile_store, tile_index, focal_store, download_options, tracing, recording):
+    global _focal_store
 
-    dsm_content = gdal.Translate("/vsimem/dsm_high_res", dsm_content, format="GTiff", widthPct=300,
-                                 heightPct=300, resampleAlg=gdalconst.GRA_CubicSpline)
+    gdal.UseExceptions()
+    if recording:
+        start_recording()
+    _focal_store = focal_store
+    set_tile_cache(tile_cache)
+    set_tile_store(tile_store)
+    set_tile_index(tile_index)
+    configure_downloads(**download_options)
+    if tracing:
+        set_tracer(Tracer())
+
+
+def estimate_worker_task(data_frame, batch, local_upsample):
+    results = estimate_task(data_frame, batch, local_upsample)
+    tracer = get_tracer()
+    return results, [] if tracer is None else tracer.pop_records(), pop_failures()
+
+
+def estimate_rows_parallel(data_frame, batch, local_upsample, workers):
+    tasks = split_tasks(data_frame, batch)
+    tracer = get_tracer()
+
+    initargs = (get_tile_cache(), get_tile_store(), get_tile_index(), _focal_store, get_download_options(),
+                tracer is not None, is_recording())
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=initargs) as executor:
+        for results, records, failures in executor.map(estimate_worker_task, tasks, repeat(batch),
+                                                       repeat(local_upsample)):
+            for record in records:
+                tracer.add_record(record)
+            add_failures(failures)
+            yield from results
+
+
+def estimate_rows_with_store(data_frame, feature_store, estimate):
+    keys = pd.Series([feature_store.key(longitude, latitude)
+                      for longitude, latitude in zip(data_frame['longitude'], data_frame['latitude'])],
+                     index=data_frame.index, dtype=object)
+    stored = feature_store.get_many(set(keys))
+
+    is_stored = keys.isin(list(stored))
+    for index, row in data_frame[is_stored].iterrows():
+        count("feature_store_hits")
+        yield row, dict(stored[keys[index]])
+
+    # Photos sharing the same coordinates are estimated once and the features are reused for the others.
+    missing = data_frame[~is_stored]
+    is_duplicate = keys[missing.index].duplicated()
+    duplicates = OrderedDict()
+    for index, row in missing[is_duplicate].iterrows():
+        duplicates.setdefault(keys[index], []).append(row)
+
+    for row, result in estimate(missing[~is_duplicate]):
+        key = keys[row.name]
+        count("feature_store_misses")
+        if result is not None:
+            feature_store.put(key, result)
+
+        features = None if result is None else dict(result)
+        for duplicate in duplicates.get(key, []):
+            if result is None:
+                record_duplicate_failure(row['filename'], duplicate['filename'])
+
+        yield row, result
+        for duplicate in duplicates.get(key, []):
+            yield duplicate, None if features is None else dict(features)
+
+
+def sort_by_filenames(result_df, filenames):
+    order = {filename: index for index, filename in enumerate(filenames)}
+    result_df['order'] = result_df['filename'].astype(str).map(order)
+    return result_df.sort_values('order', kind='mergesort').drop(columns='order').reset_index(drop=True)
+
+
+def get_values(data_frame, font, output_name, batch=False, local_upsample=False, workers=1, parquet=False,
+               feature_store=None, failure_ledger=None, retry_failed=False):
+    columns_names = ['filename', 'class', 'font'] + get_feature_names()
+    parquet_name = str(Path(output_name).with_suffix(".parquet")) if parquet else None
+
+    with ResultWriter(output_name, columns_names, parquet_name=parquet_name) as result_writer:
+        progress_bar = tqdm(total=data_frame.shape[0])
+        filenames = data_frame['filename'].astype(str)
+        skipped = filenames.isin(result_writer.done) | filenames.duplicated()
+        if failure_ledger is not None:
+            # Photos whose tiles were missing are skipped without fetching anything, the other failures are retried.
+            start_recording()
+            skipped |= pd.Series(failure_ledger.skip(filenames, retry_failed), index=filenames.index, dtype=bool)
+        progress_bar.update(int(skipped.sum()))
+        pending = data_frame[~skipped]
+
+        def estimate(rows):
+            if workers > 1:
+                return estimate_rows_parallel(rows, batch, local_upsample, workers)
+            return estimate_rows(rows, batch, local_upsample)
+
+        if feature_store is not None:
+            estimations = estimate_rows_with_store(pending, feature_store, estimate)
+        else:
+            estimations = estimate(pending)
+
+        for row, result in estimations:
+            progress_bar.update(1)
+
+            if failure_ledger is not None:
+                for failure in pop_failures():
+                    failure_ledger.record(failure)
+
+            if result is None:
+                continue
 
-    dsm_info = get_geotiff_info(dsm_content)
-    init_position = get_position_in_raster(longitude, latitude, dsm_info)
+            if failure_ledger is not None:
+                failure_ledger.resolve(row['filename'])
 
-    eight_neighbors = get_8_neighbors_position(init_position)
-    eight_neighbors_diffs = get_differences(init_position, eight_neighbors, dsm_info)
-    keys = ["eight_neighbors_avg", "eight_neighbors_min", "eight_neighbors_max"]
-    result = fill_result(result, keys, eight_neighbors_diffs)
+            result['filename'] = str(row['filename'])
+            result['class'] = int(row['class'])
+            result['font'] = font
+            result_writer.write(result)
 
-    twenty_four_neighbors = get_24_neighbors_position(init_position)
-    twenty_four_neighbors_diffs = get_differences(init_position, twenty_four_neighbors, dsm_info)
-    keys = ["twenty_four_neighbors_avg", "twenty_four_neighbors_min", "twenty_four_neighbors_max"]
-    result = fill_result(result, keys, twenty_four_neighbors_diffs)
+    result_df = pd.read_csv(output_name)
 
-    forty_eight_neighbors = get_48_neighbors_position(init_position)
-    forty_eight_diffs = get_differences(init_position, forty_eight_neighbors, dsm_info)
-    keys = ["forty_eight_neighbors_avg", "forty_eight_neighbors_min", "forty_eight_neighbors_max"]
-    result = fill_result(result, keys, forty_eight_diffs)
+    if batch or feature_store is not None:
+        result_df = sort_by_filenames(result_df, filenames)
+        result_df.to_csv(output_name, index=False)
+        if parquet_name is not None:
+            result_df.to_parquet(parquet_name, index=False)
+
+    return result_df
 
-    eighty_neighbors = get_80_neighbors_position(init_position)
-    eighty_neighbors_diffs = get_differences(init_position, eighty_neighbors, dsm_info)
-    keys = ["eighty_neighbors_avg", "eighty_neighbors_min", "eighty_neighbors_max"]
-    result = fill_result(result, keys, eighty_neighbors_diffs)
 
-    one_hundred_twenty_neighbors = get_120_neighbors_position(init_position)
-    one_hundred_twenty_neighbors_diffs = get_differences(init_position, one_hundred_twenty_neighbors, dsm_info)
-    keys = ["one_hundred_twenty_neighbors_avg", "one_hundred_twenty_neighbors_min", "one_hundred_twenty_neighbors_max"]
-    result = fill_result(result, keys, one_hundred_twenty_neighbors_diffs)
+def fetch_photo(photo):
+    prefix = create_namespace()
+    try:
+        dsm_content, neighbors = fetch_mosaic_tiles(photo, prefix)
+    except (RuntimeError, TypeError):
+        remove_namespace(prefix)
+        return photo, None, None, None
 
-    one_hundred_sixty_eight_neighbors = get_168_neighbors_position(init_position)
-    one_hundred_sixty_eight_neighbors_diffs = get_differences(init_position, one_hundred_sixty_eight_neighbors, dsm_info)
-    keys = ["one_hundred_sixty_eight_neighbors_avg", "one_hundred_sixty_eight_neighbors_min", "one_hundred_sixty_eight_neighbors_max"]
-    result = fill_result(result, keys, one_hundred_sixty_eight_neighbors_diffs)
+    return photo, prefix, dsm_content, neighbors
+
+
+def estimate_photo(fetched, local_upsample=False):
+    photo, prefix, dsm_content, neighbors = fetched
+    start = time.perf_counter()
+
+    result = None
+    if prefix is not None:
+        try:
+            dsm_content = build_dsm([photo], dsm_content, prefix, neighbors, local_upsample)
+            result = compute_features([photo], dsm_content)[0]
+        except (RuntimeError, TypeError):
+            result = None
+        finally:
+            remove_namespace(prefix)
+
+    tracer = get_tracer()
+    if tracer is not None:
+        filenames = [str(photo['filename'])]
+        tracer.finish_unit(filenames, filenames if result is None else [], time.perf_counter() - start)
+
+    return photo, result
+
+
+def classify_photo(estimated, font):
+    photo, result = estimated
+    if result is None:
+        return None
+
+    # Photos of a live event usually have no ground-truth class, their features are written without a height.
+    result['filename'] = str(photo['filename'])
+    result['class'] = None if photo.get('class') is None else int(photo['class'])
+    result['font'] = photo.get('font', font)
+    result['height'] = None
+
+    severity = SEVERITY_CLASSES.get(result['class'])
+    if severity is not None:
+        result['class'] = severity
+        result['height'] = clamp_height(severity, compute_height(result))
 
-    gdal.Unlink("/vsimem/dsm_high_res")
     return result
 
 
-def get_values(data_frame, font, output_name):
-    columns_names = ['filename', 'class', 'font', 'eight_neighbors_avg', 'eight_neighbors_min', 'eight_neighbors_max',
-                     'twenty_four_neighbors_avg', 'twenty_four_neighbors_min', 'twenty_four_neighbors_max',
-                     'forty_eight_neighbors_avg', 'forty_eight_neighbors_min', 'forty_eight_neighbors_max',
-                     'eighty_neighbors_avg', 'eighty_neighbors_min', 'eighty_neighbors_max',
-                     'one_hundred_twenty_neighbors_avg', 'one_hundred_twenty_neighbors_min',
-                     'one_hundred_twenty_neighbors_max', 'one_hundred_sixty_eight_neighbors_avg',
-                     'one_hundred_sixty_eight_neighbors_min', 'one_hundred_sixty_eight_neighbors_max']
+def skip_photo(item, exception):
+    photo = item[0] if isinstance(item, tuple) else item
+    print("Skipping photo {}: {!r}".format(photo.get('filename'), exception), file=sys.stderr)
 
-    if Path(output_name).is_file():
-        result_df = pd.read_csv(output_name)
-    else:
-        result_df = pd.DataFrame(columns=columns_names)
 
-    progress_bar = tqdm(total=data_frame.shape[0])
-    for index, row in data_frame.iterrows():
-        progress_bar.update(1)
+def estimate_stream(photos, output_name, font="stream", local_upsample=False, queue_size=4):
+    columns_names = ['filename', 'class', 'font'] + get_feature_names() + ['height']
 
-        if str(row['filename']) not in result_df['filename'].values.astype(str):
-            try:
-                result = flood_severity_estimation(row)
-            except (RuntimeError, TypeError):
-                continue
+    # Every photo is written as soon as it is classified, so the output follows a live stream.
+    with ResultWriter(output_name, columns_names, batch_size=1) as result_writer:
+        pending = (photo for photo in photos if str(photo.get('filename')) not in result_writer.done)
 
-            result['filename'] = str(row['filename'])
-            result['class'] = int(row['class'])
-            result['font'] = font
+        # Each stage runs in its own thread, so the tiles of the next photos are fetched while the current photo is
+        # estimated. The bounded queues keep the number of photos in flight, and their tiles, constant.
+        stages = [geocode_photo, fetch_photo, partial(estimate_photo, local_upsample=local_upsample),
+                  partial(classify_photo, font=font)]
+        for result in tqdm(stream(pending, stages, queue_size, on_error=skip_photo)):
+            result_writer.write(result)
 
-            result_df.loc[len(result_df)] = result
-            result_df.to_csv(output_name, index=False)
 
-    return result_df
+def build_warm_dsm(rows, dsm_content, prefix, neighbors):
+    # The filled mosaic stays in memory between requests, only a window around the photos is clipped and upsampled.
+    filled_dsm = get_memoized_filled_dsm(rows, dsm_content, neighbors)
+    if filled_dsm is None:
+        return build_dsm(rows, dsm_content, prefix, neighbors, local_upsample=True)
+
+    window = get_points_window(filled_dsm, [(row['longitude'], row['latitude']) for row in rows])
+    return upsample_dsm(clip_dsm(filled_dsm, prefix + "/dsm_clipped", window), prefix + "/dsm_high_res")
+
+
+def estimate_service_photo(photo, feature_store=None):
+    if feature_store is not None:
+        key = feature_store.key(photo['longitude'], photo['latitude'])
+        stored = feature_store.get_many([key])
+        if key in stored:
+            count("feature_store_hits")
+            return stored[key]
+
+    with vsimem_namespace() as prefix:
+        if is_indexed(get_mosaic_tiles(photo)):
+            features = compute_features([photo], build_indexed_dsm([photo], prefix))[0]
+        else:
+            dsm_content, neighbors = fetch_mosaic_tiles(photo, prefix)
+            features = compute_features([photo], build_warm_dsm([photo], dsm_content, prefix, neighbors))[0]
+
+    if feature_store is not None:
+        count("feature_store_misses")
+        feature_store.put(key, features)
+    return features
+
+
+def estimate_service_photos(photos, feature_store=None):
+    try:
+        photos = [geocode_photo(dict(photo)) for photo in photos]
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("The latitude and longitude of the photos should be finite numbers.")
+    if any(photo is None or abs(photo['latitude']) > 90 or abs(photo['longitude']) > 180 for photo in photos):
+        raise ValueError("Photos should have a latitude in [-90, 90] and a longitude in [-180, 180].")
+
+    # Photos of the same tile and quadrant are estimated one after the other, so they share the same mosaic.
+    order = sorted(range(len(photos)), key=lambda index: (photos[index]['latitude_converted'],
+                                                          photos[index]['longitude_converted'],
+                                                          predict_quadrant(photos[index]).value))
+
+    results = [None] * len(photos)
+    with _service_lock:
+        for index in order:
+            photo = photos[index]
+            result = {name: photo[name] for name in ('filename', 'class', 'latitude', 'longitude') if name in photo}
+            start = time.perf_counter()
+
+            try:
+                features = estimate_service_photo(photo, feature_store)
+            except (RuntimeError, TypeError) as e:
+                result['error'] = str(e) or "The features of the photo could not be estimated."
+            else:
+                result['features'] = features
+                result['height'] = None
+                severity = SEVERITY_CLASSES.get(photo.get('class'))
+                if severity is not None:
+                    result['height'] = clamp_height(severity, compute_height(dict(features, **{'class': severity})))
+
+            tracer = get_tracer()
+            if tracer is not None:
+                filenames = [str(photo.get('filename', index))]
+                tracer.finish_unit(filenames, filenames if 'error' in result else [], time.perf_counter() - start)
+
+            results[index] = result
+
+    return results
+
+
+def serve(address, feature_store=None):
+    host, _, port = address.rpartition(":")
+
+    # The fallback rasters are opened before the first request instead of during it.
+    for path in (SRTM_PATH, EU_DEM_PATH):
+        if os.path.exists(path):
+            open_fallback_dem(path)
+
+    server = EstimationServer((host or "127.0.0.1", int(port)),
+                              partial(estimate_service_photos, feature_store=feature_store))
+    print("Serving on http://{}:{}".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Flood Severity Estimation Algorithm")
+    add_dataset_arguments(parser)
+    add_tile_arguments(parser)
+    add_estimation_arguments(parser)
+    parser.add_argument("--import-tiles", metavar="DIRECTORY",
+                        help="convert the AW3D30 GeoTIFF tiles of a directory into the tile store and exit")
+    parser.add_argument("--stream",
+                        help="estimate the photos of a JSON lines stream (filename, class, latitude and longitude "
+                             "of each photo), \"-\" reads from stdin")
+    parser.add_argument("--stream-output", default="./values_plots_dem/values_stream.csv",
+                        help="output of the values and heights of the streamed photos")
+    parser.add_argument("--stream-queue-size", type=int, default=4,
+                        help="number of photos buffered between the stages of the stream")
+    parser.add_argument("--serve", metavar="HOST:PORT",
+                        help="serve the estimation as a local HTTP/JSON service instead of processing the datasets")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="download every tile the datasets need into the tile store or the tile cache before "
+                             "the estimation")
+    parser.add_argument("--prefetch-dry-run", action="store_true",
+                        help="only report the number of tiles the datasets need and the bytes to download")
+    parser.add_argument("--merge-shards", action="store_true",
+                        help="merge the outputs of every shard and produce the classes and the plot")
+    return parser.parse_args()
+
+
+def open_feature_store(args, *options):
+    if not args.feature_store:
+        return None
+
+    # Windows read from the tile index are not clipped from the same mosaics, their features are kept apart.
+    Path(args.feature_store).parent.mkdir(parents=True, exist_ok=True)
+    return FeatureStore(args.feature_store, get_dem_version(*options, "tile_index" if args.tile_index else "mosaic"))
+
+
+def estimate_datasets(args):
+    feature_store = open_feature_store(args, args.local_upsample)
+    shard = parse_shard(args.shard) if args.shard else None
+
+    failure_ledger = None
+    if args.failure_ledger:
+        Path(args.failure_ledger).parent.mkdir(parents=True, exist_ok=True)
+        failure_ledger = FailureLedger(args.failure_ledger, get_dem_version(args.local_upsample))
+
+    results = []
+    for font, output_name in DATASETS:
+        data_frame = load_dataset(font, args.metadata_cache)
+        if shard is not None:
+            data_frame = select_shard(data_frame, shard)
+            output_name = get_shard_output_name(output_name, shard)
+
+        results.append(get_values(data_frame,
+                                  font=font,
+                                  output_name=output_name,
+                                  batch=args.batch,
+                                  local_upsample=args.local_upsample,
+                                  workers=args.workers,
+                                  parquet=args.parquet,
+                                  feature_store=feature_store,
+                                  failure_ledger=failure_ledger,
+                                  retry_failed=args.retry_failed))
+
+    if feature_store is not None:
+        feature_store.close()
+    if failure_ledger is not None:
+        failure_ledger.close()
+        print_failure_summary(failure_ledger.summary())
+
+    return results
+
+
+def prefetch_datasets(args, dry_run=False):
+    if not dry_run and get_tile_store() is None and get_tile_cache() is None:
+        raise SystemExit("Prefetching requires --tile-store or --tile-cache.")
+    shard = parse_shard(args.shard) if args.shard else None
+
+    data_frames = []
+    for font, _ in DATASETS:
+        data_frame = load_dataset(font, args.metadata_cache)
+        if shard is not None:
+            data_frame = select_shard(data_frame, shard)
+        data_frames.append(data_frame)
+
+    print_prefetch_summary(prefetch_tiles(plan_tiles(data_frames), dry_run=dry_run))
+
+
+def merge_datasets(args):
+    results = []
+    for font, output_name in DATASETS:
+        result_df = merge_shard_outputs(output_name)
+        result_df = sort_by_filenames(result_df, load_dataset(font, args.metadata_cache)['filename'].astype(str))
+        result_df.to_csv(output_name, index=False)
+        results.append(result_df)
+
+    draw_results(results)
+
+
+def draw_results(results):
+    draw_plot(classify_values(results))
+
+
+def configure_tiles(args):
+    if args.tile_store:
+        set_tile_store(TileStore(args.tile_store))
+    if args.tile_cache:
+        set_tile_cache(TileCache(args.tile_cache, max_bytes=args.tile_cache_size * 1024 * 1024))
+    configure_downloads(url=args.dsm_url, timeout=args.download_timeout, retries=args.download_retries,
+                        concurrency=args.download_concurrency)
+
+
+def configure_estimation(args):
+    global FILLED_DSMS_SIZE, _focal_store
+
+    FILLED_DSMS_SIZE = args.mosaic_cache_size
+    if args.tile_index:
+        tile_source = get_tile_store() or get_tile_cache()
+        if tile_source is None:
+            raise SystemExit("--tile-index requires --tile-store or --tile-cache.")
+        set_tile_index(TileIndex(args.tile_index, tile_source.tiles()))
+    if args.focal_store:
+        _focal_store = FocalStore(args.focal_store, get_dem_version(args.local_upsample))
+    if args.trace:
+        set_tracer(Tracer(args.trace))
+
+
+def close_tracer(args):
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.close()
+        summary = tracer.summary()
+        print_summary(summary)
+        with open(str(Path(args.trace).with_suffix(".summary.json")), "w") as f:
+            json.dump(summary, f, indent=2)
 
 
 def main():
-    mediaeval_test_df = get_flooded_mediaeval_info("./datasets/mediaeval2017_testset_gt.csv",
-                                                   "./datasets/mediaeval2017_testset_metadata.json")
-    result_mediaeval_test = get_values(mediaeval_test_df,
-                                       font="mediaeval_2017_test",
-                                       output_name="./values_plots_dem/values_mediaeval_test.csv")
-
-    mediaeval_train_df = get_flooded_mediaeval_info("./datasets/mediaeval2017_devset_gt.csv",
-                                                    "./datasets/mediaeval2017_devset_metadata.json")
-    result_mediaeval_train = get_values(mediaeval_train_df,
-                                        font="mediaeval_2017_train",
-                                        output_name="./values_plots_dem/values_mediaeval_train.csv")
-
-    european_df = get_flooded_europeanfloods_info()
-    result_european_floods = get_values(european_df,
-                                        font="european_floods_2013",
-                                        output_name="./values_plots_dem/values_european_floods.csv")
-
-    result = result_mediaeval_test.append(result_mediaeval_train, ignore_index=True)
-    result = result.append(result_european_floods, ignore_index=True)
-    result = replace_class(result)
-    draw_plot(result)
+    args = parse_arguments()
+
+    if args.import_tiles:
+        if not args.tile_store:
+            raise SystemExit("--import-tiles requires --tile-store.")
+        imported = TileStore(args.tile_store).import_directory(args.import_tiles)
+        print("Imported {} tiles into {}.".format(imported, args.tile_store))
+        return
+
+    configure_tiles(args)
+    if args.prefetch_dry_run:
+        prefetch_datasets(args, dry_run=True)
+        return
+    if args.prefetch:
+        # The tiles are fetched before the tile index is built, so the index covers them.
+        prefetch_datasets(args)
+    configure_estimation(args)
+
+    if args.serve:
+        feature_store = open_feature_store(args, "service")
+        serve(args.serve, feature_store)
+        if feature_store is not None:
+            feature_store.close()
+    elif args.merge_shards:
+        merge_datasets(args)
+    elif args.stream:
+        estimate_stream(read_photo_stream(args.stream), args.stream_output,
+                        local_upsample=args.local_upsample,
+                        queue_size=args.stream_queue_size)
+    else:
+        results = estimate_datasets(args)
+        # The classes and the plot need the results of every shard, they are produced by --merge-shards.
+        if not args.shard:
+            draw_results(results)
+
+    close_tracer(args)
 
 
 if __name__ == '__main__':
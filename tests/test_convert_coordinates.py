@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.dataset_utils import convert_coordinates, round_coordinates
+
+BOUNDARY_LONGITUDES = [0.0, -0.0, 1.0, -1.0, 0.5, -0.5, 179.5, -179.5, 180.0, -180.0,
+                       np.nextafter(0.0, -1.0), np.nextafter(-1.0, -2.0), np.nextafter(1.0, 0.0),
+                       np.nextafter(180.0, 0.0), np.nextafter(-180.0, 0.0)]
+BOUNDARY_LATITUDES = [0.0, -0.0, 1.0, -1.0, 0.5, -0.5, 89.5, -89.5, 90.0, -90.0,
+                      np.nextafter(0.0, -1.0), np.nextafter(-1.0, -2.0), np.nextafter(1.0, 0.0),
+                      np.nextafter(90.0, 0.0), np.nextafter(-90.0, 0.0)]
+
+
+def assert_same_names(longitudes, latitudes):
+    longitude_converted, latitude_converted, _, _ = convert_coordinates(longitudes, latitudes)
+    for longitude, latitude, converted in zip(longitudes, latitudes, zip(longitude_converted, latitude_converted)):
+        assert converted == round_coordinates(longitude, latitude), (longitude, latitude)
+
+
+def test_boundary_coordinates():
+    longitudes, latitudes = np.meshgrid(BOUNDARY_LONGITUDES, BOUNDARY_LATITUDES)
+    assert_same_names(longitudes.ravel(), latitudes.ravel())
+
+
+def test_random_coordinates():
+    random_state = np.random.RandomState(0)
+    assert_same_names(random_state.uniform(-180, 180, 20000), random_state.uniform(-90, 90, 20000))
+
+
+def test_integer_coordinates():
+    longitudes, latitudes = np.meshgrid(np.arange(-180, 181, dtype=float), np.arange(-90, 91, 5, dtype=float))
+    assert_same_names(longitudes.ravel(), latitudes.ravel())
+
+
+@pytest.mark.parametrize("longitude, latitude", [(-1.0, 0.0), (-0.5, -0.5), (0.5, 0.5)])
+def test_tile_indices_are_the_south_western_edges(longitude, latitude):
+    _, _, longitude_index, latitude_index = convert_coordinates([longitude], [latitude])
+    longitude_converted, latitude_converted = round_coordinates(longitude, latitude)
+
+    sign_x = -1 if longitude_converted[0] == "W" else 1
+    sign_y = -1 if latitude_converted[0] == "S" else 1
+    assert longitude_index[0] == sign_x * int(longitude_converted[1:])
+    assert latitude_index[0] == sign_y * int(latitude_converted[1:])
+
+
+def test_missing_coordinates():
+    longitude_converted, latitude_converted, _, _ = convert_coordinates(
+        pd.Series([11.5, np.nan, 11.5, np.inf], dtype=object), pd.Series([48.5, 48.5, None, 48.5], dtype=object))
+
+    assert list(longitude_converted) == ["E011", None, None, None]
+    assert list(latitude_converted) == ["N048", None, None, None]
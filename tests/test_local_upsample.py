@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+gdal = pytest.importorskip("gdal")
+
+import utils.dem_utils as dem_utils
+from benchmarks.synthetic_data import generate_dataset, get_tile_directory
+from benchmarks.tile_server import TileServer
+from flood_severity_estimation import build_dsm, compute_features
+from utils.dataset_utils import round_coordinates
+from utils.dem_utils import configure_downloads, fetch_mosaic_tiles, get_tile_cache, set_tile_cache
+from utils.tile_cache import TileCache
+from utils.vsimem_utils import vsimem_namespace
+
+TILES = [(latitude, longitude) for latitude in ("N047", "N048", "N049") for longitude in ("E010", "E011", "E012")]
+# Smaller tiles than AW3D30 keep the test fast, the windows and the upsampling grid do not depend on the size.
+TILE_SIZE = 360
+
+# Elevations are in meters, the local upsample must match the full one to well below the DSM resolution.
+TOLERANCE = 1e-3
+
+# Nodata holes of the center tile (first row, first column, height, width, in source pixels) around the photos of
+# HOLE_COORDINATES: next to a photo, across the edge of its 8 pixel window, and under a photo.
+HOLES = [(250, 110, 4, 3), (244, 132, 18, 6), (251, 143, 4, 4)]
+HOLE_COORDINATES = [(11.3, 48.3), (11.35, 48.3), (11.4, 48.3)]
+
+COORDINATES = [
+    (11.5, 48.5),
+    # Next to the edges and the corners of the center tile, where the mosaic includes the neighbor tiles.
+    (11.0004, 48.5), (11.9996, 48.5), (11.5, 48.0004), (11.5, 48.9996),
+    (11.0004, 48.0004), (11.9996, 48.9996), (11.0004, 48.9996), (11.9996, 48.0004),
+    (11.25, 48.75), (11.75, 48.25),
+]
+
+
+def make_row(longitude, latitude, filename=0):
+    longitude_converted, latitude_converted = round_coordinates(longitude, latitude)
+    return pd.Series({'filename': filename, 'class': 1, 'longitude': longitude, 'latitude': latitude,
+                      'longitude_converted': longitude_converted, 'latitude_converted': latitude_converted})
+
+
+def estimate(rows, local_upsample):
+    with vsimem_namespace() as prefix:
+        dsm_content, neighbors = fetch_mosaic_tiles(rows[0], prefix)
+        dsm_content = build_dsm(rows, dsm_content, prefix, neighbors, local_upsample)
+        return compute_features(rows, dsm_content)
+
+
+def punch_holes(path, holes):
+    dataset = gdal.Open(path, gdal.GA_Update)
+    band = dataset.GetRasterBand(1)
+    for row_start, col_start, height, width in holes:
+        band.WriteArray(np.full((height, width), band.GetNoDataValue(), dtype=np.int16), col_start, row_start)
+    dataset.FlushCache()
+
+
+def assert_features_close(local, full):
+    assert local.keys() == full.keys()
+    for name in full:
+        assert abs(local[name] - full[name]) <= TOLERANCE, name
+
+
+@pytest.fixture(scope="module", autouse=True)
+def synthetic_tiles(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("synthetic"))
+    tiles_directory, srtm_path, eu_dem_path = generate_dataset(directory, TILES, size=TILE_SIZE, holes=0)
+    punch_holes(os.path.join(tiles_directory, get_tile_directory("N048"), "N048E011_AVE_DSM.tif"), HOLES)
+    paths, tile_cache = (dem_utils.SRTM_PATH, dem_utils.EU_DEM_PATH), get_tile_cache()
+
+    gdal.UseExceptions()
+    with TileServer(tiles_directory) as server:
+        configure_downloads(url=server.url)
+        set_tile_cache(TileCache(str(tmp_path_factory.mktemp("tile_cache"))))
+        dem_utils.SRTM_PATH, dem_utils.EU_DEM_PATH = srtm_path, eu_dem_path
+        yield
+
+    dem_utils.SRTM_PATH, dem_utils.EU_DEM_PATH = paths
+    set_tile_cache(tile_cache)
+
+
+@pytest.mark.parametrize("longitude, latitude", COORDINATES)
+def test_local_upsample_matches_full_upsample(longitude, latitude):
+    row = make_row(longitude, latitude)
+    assert_features_close(estimate([row], True)[0], estimate([row], False)[0])
+
+
+@pytest.mark.parametrize("longitude, latitude", HOLE_COORDINATES)
+def test_local_upsample_matches_full_upsample_with_filled_holes(longitude, latitude):
+    # The clipped mosaic is filled from the fallback DEMs reprojected into the window only.
+    row = make_row(longitude, latitude)
+    assert_features_close(estimate([row], True)[0], estimate([row], False)[0])
+
+
+def test_local_upsample_matches_full_upsample_for_groups():
+    # The window of a group spans all of its photos, so photos far from each other are still far from its edges.
+    rows = [make_row(longitude, latitude, index) for index, (longitude, latitude) in enumerate(COORDINATES)
+            if longitude > 11.5 and latitude < 48.5]
+    for local, full in zip(estimate(rows, True), estimate(rows, False)):
+        assert_features_close(local, full)
+
+
+def test_local_upsample_windows_are_small():
+    row = make_row(11.5, 48.5)
+    with vsimem_namespace() as prefix:
+        dsm_content, neighbors = fetch_mosaic_tiles(row, prefix)
+        dsm_content = build_dsm([row], dsm_content, prefix, neighbors, True)
+        size = dsm_content.RasterXSize, dsm_content.RasterYSize
+
+    window = 3 * (2 * dem_utils.UPSAMPLE_MARGIN + 1)
+    assert np.all(np.asarray(size) <= window)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from utils.neighborhood_utils import RADII, compute_neighborhood_features, focal_statistics, get_feature_names
+
+NO_DATA_VALUE = -9999
+
+
+def get_neighbors_position(current_position, radius):
+    # The get_N_neighbors_position functions of the row loop.
+    row, col = current_position
+    return [(row - x, col - y) for x in range(-radius, radius + 1) for y in range(-radius, radius + 1)
+            if x != 0 or y != 0]
+
+
+def loop_features(data, point, no_data_value=None):
+    # get_differences and fill_result of the row loop, leaving out the neighbors outside the raster or without data.
+    center = data[point[0]][point[1]]
+    result = {}
+    for radius, names in zip(RADII, np.reshape(get_feature_names(), (-1, 3))):
+        values = [abs(float(data[row][col]) - float(center)) for row, col in get_neighbors_position(point, radius)
+                  if 0 <= row < data.shape[0] and 0 <= col < data.shape[1] and data[row][col] != no_data_value]
+        if values and center != no_data_value:
+            result.update(zip(names, [np.mean(values), min(values), max(values)]))
+        else:
+            result.update(zip(names, [np.nan] * 3))
+    return result
+
+
+def assert_features_close(features, expected):
+    for name in get_feature_names():
+        np.testing.assert_allclose(features[name], expected[name], rtol=1e-6, atol=1e-6, err_msg=name)
+
+
+@pytest.fixture
+def data():
+    return np.random.RandomState(0).normal(300, 20, size=(40, 50)).astype(np.float32)
+
+
+def test_interior_points_match_row_loop(data):
+    points = [(row, col) for row in range(6, 34, 3) for col in range(6, 44, 5)]
+    for features, point in zip(compute_neighborhood_features(data, points), points):
+        assert_features_close(features, loop_features(data, point))
+
+
+def test_points_near_the_edges(data):
+    points = [(0, 0), (0, 25), (39, 49), (2, 47), (38, 3), (5, 0), (20, 49)]
+    for features, point in zip(compute_neighborhood_features(data, points), points):
+        assert_features_close(features, loop_features(data, point))
+
+
+def test_no_data_neighbors_are_left_out(data):
+    data[10:14, 10:13] = NO_DATA_VALUE
+    data[0, :5] = NO_DATA_VALUE
+    points = [(15, 15), (12, 9), (8, 8), (1, 2), (16, 11)]
+    for features, point in zip(compute_neighborhood_features(data, points, no_data_value=NO_DATA_VALUE), points):
+        assert_features_close(features, loop_features(data, point, NO_DATA_VALUE))
+
+
+def test_no_data_center_has_no_features(data):
+    data[20, 20] = NO_DATA_VALUE
+    features = compute_neighborhood_features(data, [(20, 20)], no_data_value=NO_DATA_VALUE)[0]
+    assert all(np.isnan(features[name]) for name in get_feature_names())
+
+
+def test_focal_statistics_match_points(data):
+    data[10:14, 10:13] = NO_DATA_VALUE
+    focal = focal_statistics(data, no_data_value=NO_DATA_VALUE, chunk_rows=7)
+    points = [(row, col) for row in range(0, 40, 4) for col in range(0, 50, 6)]
+    for features, point in zip(compute_neighborhood_features(data, points, no_data_value=NO_DATA_VALUE), points):
+        expected = [features[name] for name in get_feature_names()]
+        np.testing.assert_allclose(focal[:, point[0], point[1]], expected, rtol=1e-5, atol=1e-4)
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.dataset_utils import replace_class
+from utils.plot_utils import HEIGHT_NEIGHBORHOODS, compute_height, clamp_height, compute_heights, clamp_heights
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILENAMES = [25441112, 26454139, 10625277256, 26454429, 26457940, 25441113]
+
+
+def random_result(random_state, size):
+    result = pd.DataFrame({'class': random_state.choice([1, 2], size)})
+    for name in ["eight_neighbors"] + HEIGHT_NEIGHBORHOODS:
+        for statistic in ("min", "avg", "max"):
+            values = random_state.uniform(0, 4, size)
+            values[random_state.uniform(size=size) < 0.1] = np.nan
+            result[name + "_" + statistic] = values
+    return result
+
+
+def test_heights_match_the_row_loop():
+    result = random_result(np.random.RandomState(0), 2000)
+    expected = [compute_height(row) for _, row in result.iterrows()]
+    np.testing.assert_array_equal(compute_heights(result), expected)
+
+
+def test_clamped_heights_match_the_row_loop():
+    result = random_result(np.random.RandomState(1), 2000)
+    severities, heights = result['class'].to_numpy(), compute_heights(result)
+    expected = [clamp_height(severity, height) for severity, height in zip(severities, heights)]
+    np.testing.assert_array_equal(clamp_heights(severities, heights), expected)
+
+
+def test_heights_reject_unknown_classes():
+    result = random_result(np.random.RandomState(2), 10)
+    result.loc[3, 'class'] = 0
+    with pytest.raises(ValueError):
+        compute_heights(result)
+
+
+def replace_class_loop(result_df):
+    # Row by row lookup of the severity classes, as replace_class did before it was vectorized.
+    names = ["mediaeval2017_testset", "mediaeval2017_devset", "european_floods_2013"]
+    values_final = pd.concat([pd.read_csv("./datasets/{}_severity.csv".format(name), names=['filename', 'class'])
+                              for name in names], ignore_index=True).astype(str).set_index('filename')
+
+    classes = [values_final.loc[str(int(row['filename'])), 'class'] for _, row in result_df.iterrows()]
+    result_df = result_df.assign(**{'class': classes})
+    result_df['filename'] = result_df['filename'].astype(int).astype(str)
+    result_df['class'] = result_df['class'].astype(int)
+
+    result_df = result_df.replace({'class': {3: 2}})
+    return result_df.drop(result_df[result_df['class'] == 4].index).reset_index(drop=True)
+
+
+def test_replace_class_matches_the_row_loop(monkeypatch):
+    monkeypatch.chdir(REPOSITORY)
+    result_df = pd.DataFrame({'filename': [float(filename) for filename in FILENAMES],
+                              'class': [0] * len(FILENAMES), 'eight_neighbors_avg': np.arange(len(FILENAMES))})
+
+    expected = replace_class_loop(result_df)
+    pd.testing.assert_frame_equal(replace_class(result_df), expected)
+    assert list(expected['class']) == [1, 2, 2, 0, 1]
+
+
+def test_replace_class_rejects_missing_filenames(monkeypatch):
+    monkeypatch.chdir(REPOSITORY)
+    result_df = pd.DataFrame({'filename': [FILENAMES[0], 1], 'class': [0, 0]})
+
+    with pytest.raises(KeyError):
+        replace_class_loop(result_df)
+    with pytest.raises(KeyError):
+        replace_class(result_df)
@@ -0,0 +1,60 @@
+import argparse
+
+
+def non_negative_int(value):
+    if int(value) < 0:
+        raise argparse.ArgumentTypeError("should not be negative, got {}".format(value))
+    return int(value)
+
+
+def add_dataset_arguments(parser):
+    parser.add_argument("--metadata-cache", default="./cache",
+                        help="directory of the parsed metadata cache, empty to always parse the JSON files")
+    parser.add_argument("--shard", metavar="I/N",
+                        help="only process the photos of shard I (from 0) of N, partitioned by DEM tile")
+
+
+def add_tile_arguments(parser):
+    parser.add_argument("--tile-cache", default="./tiles",
+                        help="directory of the local AW3D30 tile cache, empty to always download")
+    parser.add_argument("--tile-cache-size", type=int, default=10240,
+                        help="maximum size of the tile cache in MB")
+    parser.add_argument("--tile-store",
+                        help="directory of uncompressed, memory-mapped tiles read before the tile cache")
+    parser.add_argument("--dsm-url",
+                        help="base URL of the AW3D30 tiles, for example a local mirror")
+    parser.add_argument("--download-timeout", type=float, default=60,
+                        help="timeout in seconds of each tile download")
+    parser.add_argument("--download-retries", type=int, default=3,
+                        help="number of retries, with exponential backoff, of a failed tile download")
+    parser.add_argument("--download-concurrency", type=int, default=4,
+                        help="number of tiles downloaded concurrently")
+
+
+def add_estimation_arguments(parser):
+    parser.add_argument("--tile-index",
+                        help="VRT index built at startup over the tiles of the tile store, or of the tile cache, from "
+                             "which the windows of the photos are read directly")
+    parser.add_argument("--focal-store",
+                        help="directory of the focal-statistics rasters built for the tiles processed with --batch, "
+                             "from which the features of later photos are looked up")
+    parser.add_argument("--batch", action="store_true",
+                        help="build each merged DSM once per tile and quadrant instead of once per photo")
+    parser.add_argument("--local-upsample", action="store_true",
+                        help="upsample only a window around the photos instead of the whole mosaic")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes")
+    parser.add_argument("--feature-store",
+                        help="SQLite store of the features of already processed coordinates, for example "
+                             "./cache/features.sqlite")
+    parser.add_argument("--mosaic-cache-size", type=non_negative_int, default=1,
+                        help="number of filled mosaics kept in memory, requires the tile cache, 0 to disable")
+    parser.add_argument("--failure-ledger",
+                        help="JSON lines ledger of the photos that failed, those whose tiles are missing are skipped by "
+                             "later runs, for example ./cache/failures.jsonl")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="also retry the photos of the failure ledger whose tiles were missing")
+    parser.add_argument("--trace",
+                        help="write a JSON lines trace of the stage timings and counters of each photo")
+    parser.add_argument("--parquet", action="store_true",
+                        help="also write the values of each dataset as a Parquet file")
@@ -1,24 +1,69 @@
-import datetime
 import json
+import os
+import pickle
+import sys
 
 import math
+import numpy as np
 import pandas as pd
 
+DATASETS = [("mediaeval_2017_test", "./values_plots_dem/values_mediaeval_test.csv"),
+            ("mediaeval_2017_train", "./values_plots_dem/values_mediaeval_train.csv"),
+            ("european_floods_2013", "./values_plots_dem/values_european_floods.csv")]
 
-def read_dataset_and_metadata(dataset_path, metadata_path, drop_no_flood):
+# Values of every dataset with the severity classes, from which the plot is drawn.
+CLASSIFIED_NAME = "./values_plots_dem/values_classified.csv"
+
+
+def read_dataset(dataset_path, drop_no_flood):
     flooded_df = pd.read_csv(dataset_path, names=['filename', 'class'])
 
     if drop_no_flood:
         flooded_df = flooded_df.drop(flooded_df[flooded_df['class'] != 1].index).reset_index(drop=True)
 
-    flooded_df['year'], flooded_df['month'], flooded_df['day'] = None, None, None
-    flooded_df['latitude_converted'], flooded_df['longitude_converted'] = None, None
-    flooded_df['latitude'], flooded_df['longitude'] = None, None
+    return flooded_df
+
+
+def read_metadata(metadata_path, parse, cache_path=None):
+    stat = os.stat(metadata_path)
+    signature = (os.path.abspath(metadata_path), stat.st_size, stat.st_mtime)
+
+    if cache_path is not None and os.path.isfile(cache_path):
+        with open(cache_path, "rb") as f:
+            cached_signature, metadata_df = pickle.load(f)
+        if cached_signature == signature:
+            return metadata_df
 
     with open(metadata_path, encoding="utf-8") as f:
-        data = json.load(f, encoding='utf-8')
+        metadata_df = parse(json.load(f))
+
+    if cache_path is not None:
+        temporary_path = "{}.{}.tmp".format(cache_path, os.getpid())
+        with open(temporary_path, "wb") as f:
+            pickle.dump((signature, metadata_df), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, cache_path)
+
+    return metadata_df
 
-    return flooded_df, data
+
+def join_metadata(flooded_df, metadata_df):
+    flooded_df = flooded_df.assign(key=flooded_df['filename'].astype(str))
+    metadata_df = metadata_df.drop_duplicates('key')
+    flooded_df = flooded_df.merge(metadata_df, on='key', how='left', sort=False).drop(columns='key')
+
+    flooded_df['year'] = flooded_df['date_taken'].dt.year
+    flooded_df['month'] = flooded_df['date_taken'].dt.month
+    flooded_df['day'] = flooded_df['date_taken'].dt.day
+
+    longitude_converted, latitude_converted, _, _ = convert_coordinates(flooded_df['longitude'],
+                                                                        flooded_df['latitude'])
+    flooded_df['longitude_converted'] = longitude_converted
+    flooded_df['latitude_converted'] = latitude_converted
+
+    columns = ['filename', 'class', 'year', 'month', 'day', 'latitude_converted', 'longitude_converted',
+               'latitude', 'longitude']
+    flooded_df = flooded_df[columns].dropna().reset_index(drop=True)
+    return flooded_df.astype({'year': int, 'month': int, 'day': int})
 
 
 def dd2dms(longitude, latitude):
@@ -57,62 +102,97 @@ def round_coordinates(longitude, latitude):
     return longitude, latitude
 
 
-def get_flooded_mediaeval_info(classification_path, metadata_path, drop_no_flood=True):
-    flooded_df, metadata = read_dataset_and_metadata(classification_path, metadata_path, drop_no_flood)
+def convert_coordinates(longitudes, latitudes):
+    # Same tile names as round_coordinates: degrees are truncated towards zero, so (-1, 0) maps to E000 and N000.
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    valid = np.isfinite(longitudes) & np.isfinite(latitudes)
 
-    for index, row in flooded_df.iterrows():
-        try:
-            image_entry = [obj for obj in metadata['images'] if obj['image_id'] == str(row['filename'])][0]
+    degrees_x = np.trunc(np.where(valid, longitudes, 0)).astype(np.int64)
+    degrees_y = np.trunc(np.where(valid, latitudes, 0)).astype(np.int64)
+
+    # Integer indices of the western and southern edge of the tiles, for grouping without the names.
+    longitude_index = np.where(degrees_x < 0, degrees_x - 1, degrees_x)
+    latitude_index = np.where(degrees_y < 0, degrees_y - 1, degrees_y)
 
-            date_taken = image_entry['date_taken'].split(".")[0]
-            date_taken = datetime.datetime.strptime(date_taken, '%Y-%m-%d %H:%M:%S').timetuple()
+    longitude_converted = np.char.add(np.where(degrees_x < 0, "W", "E"),
+                                      np.char.zfill(np.abs(longitude_index).astype(str), 3)).astype(object)
+    latitude_converted = np.char.add(np.where(degrees_y < 0, "S", "N"),
+                                     np.char.zfill(np.abs(latitude_index).astype(str), 3)).astype(object)
+    longitude_converted[~valid], latitude_converted[~valid] = None, None
 
-            row['year'] = date_taken.tm_year
-            row['month'] = date_taken.tm_mon
-            row['day'] = date_taken.tm_mday
+    return longitude_converted, latitude_converted, longitude_index, latitude_index
 
-            row['longitude'] = image_entry['longitude']
-            row['latitude'] = image_entry['latitude']
 
-            longitude_converted, latitude_converted = round_coordinates(row['longitude'], row['latitude'])
-            row['longitude_converted'] = longitude_converted
-            row['latitude_converted'] = latitude_converted
+def parse_mediaeval_metadata(metadata):
+    images = metadata['images']
+    dates = [image['date_taken'].split(".")[0] for image in images]
 
-            flooded_df.iloc[index] = row
-        except TypeError:
-            pass
+    return pd.DataFrame({
+        'key': [image['image_id'] for image in images],
+        'date_taken': pd.to_datetime(pd.Series(dates, dtype=object), format='%Y-%m-%d %H:%M:%S'),
+        'latitude': pd.Series([image['latitude'] for image in images], dtype=object),
+        'longitude': pd.Series([image['longitude'] for image in images], dtype=object),
+    })
 
-    return flooded_df.dropna().reset_index(drop=True)
+
+def parse_europeanfloods_metadata(metadata):
+    keys, dates, latitudes, longitudes = [], [], [], []
+    for entry in metadata:
+        try:
+            date_taken, coordinates = entry['capture_time'], entry['coordinates']
+            latitude, longitude = coordinates['lat'], coordinates['lon']
+        except (KeyError, TypeError):
+            continue
+
+        keys.append(str(entry['pageid']))
+        dates.append(date_taken)
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+
+    return pd.DataFrame({
+        'key': keys,
+        'date_taken': pd.to_datetime(pd.Series(dates, dtype=object), format='%Y-%m-%dT%H:%M:%S'),
+        'latitude': pd.Series(latitudes, dtype=object),
+        'longitude': pd.Series(longitudes, dtype=object),
+    })
 
 
-def get_flooded_europeanfloods_info(drop_no_flood=True):
+def get_flooded_mediaeval_info(classification_path, metadata_path, drop_no_flood=True, cache_path=None):
+    flooded_df = read_dataset(classification_path, drop_no_flood)
+    metadata_df = read_metadata(metadata_path, parse_mediaeval_metadata, cache_path)
+    return join_metadata(flooded_df, metadata_df)
+
+
+def get_flooded_europeanfloods_info(drop_no_flood=True, cache_path=None):
     classification_path = "./datasets/european_floods_2013_gt.csv"
     metadata_path = "./datasets/european_floods_2013_metadata.json"
-    flooded_df, metadata = read_dataset_and_metadata(classification_path, metadata_path, drop_no_flood)
 
-    for index, row in flooded_df.iterrows():
-        try:
-            image_entry = [obj for obj in metadata if str(obj['pageid']) == str(row['filename'])][0]
+    flooded_df = read_dataset(classification_path, drop_no_flood)
+    metadata_df = read_metadata(metadata_path, parse_europeanfloods_metadata, cache_path)
+    return join_metadata(flooded_df, metadata_df)
 
-            date_taken = image_entry['capture_time']
-            date_taken = datetime.datetime.strptime(date_taken, '%Y-%m-%dT%H:%M:%S').timetuple()
 
-            row['year'] = date_taken.tm_year
-            row['month'] = date_taken.tm_mon
-            row['day'] = date_taken.tm_mday
+def get_cache_path(metadata_cache, name):
+    if not metadata_cache:
+        return None
 
-            row['longitude'] = image_entry['coordinates']['lon']
-            row['latitude'] = image_entry['coordinates']['lat']
+    os.makedirs(metadata_cache, exist_ok=True)
+    return os.path.join(metadata_cache, "{}.pkl".format(name))
 
-            longitude_converted, latitude_converted = round_coordinates(row['longitude'], row['latitude'])
-            row['longitude_converted'] = longitude_converted
-            row['latitude_converted'] = latitude_converted
 
-            flooded_df.iloc[index] = row
-        except (KeyError, IndexError, TypeError):
-            pass
-
-    return flooded_df.dropna().reset_index(drop=True)
+def load_dataset(font, metadata_cache=None):
+    if font == "mediaeval_2017_test":
+        return get_flooded_mediaeval_info("./datasets/mediaeval2017_testset_gt.csv",
+                                          "./datasets/mediaeval2017_testset_metadata.json",
+                                          cache_path=get_cache_path(metadata_cache, "mediaeval_test_metadata"))
+    if font == "mediaeval_2017_train":
+        return get_flooded_mediaeval_info("./datasets/mediaeval2017_devset_gt.csv",
+                                          "./datasets/mediaeval2017_devset_metadata.json",
+                                          cache_path=get_cache_path(metadata_cache, "mediaeval_train_metadata"))
+    if font == "european_floods_2013":
+        return get_flooded_europeanfloods_info(cache_path=get_cache_path(metadata_cache, "european_floods_metadata"))
+    raise ValueError("Unknown dataset {}.".format(font))
 
 
 def replace_class(result_df):
@@ -120,18 +200,59 @@ def replace_class(result_df):
     values_mediaeval_train_df = pd.read_csv("./datasets/mediaeval2017_devset_severity.csv", names=['filename', 'class'])
     values_european_floods_df = pd.read_csv("./datasets/european_floods_2013_severity.csv", names=['filename', 'class'])
 
-    values_final = values_mediaeval_test_df.append(values_mediaeval_train_df, ignore_index=True)
-    values_final = values_final.append(values_european_floods_df, ignore_index=True)
-    values_final = values_final.astype(str).set_index('filename')
+    values_final = pd.concat([values_mediaeval_test_df, values_mediaeval_train_df, values_european_floods_df],
+                             ignore_index=True)
+    classes = values_final.astype(str).set_index('filename')['class']
 
-    for index, row in result_df.iterrows():
-        row['class'] = values_final.loc[str(int(row['filename'])), :]['class']
-        result_df.iloc[index] = row
+    result_df = result_df.assign(filename=result_df['filename'].astype(int).astype(str))
+    missing = ~result_df['filename'].isin(classes.index)
+    if missing.any():
+        raise KeyError(result_df.loc[missing, 'filename'].iloc[0])
 
-    result_df['filename'] = result_df['filename'].astype(int).astype(str)
-    result_df['class'] = result_df['class'].astype(int)
+    result_df['class'] = result_df['filename'].map(classes).astype(int)
 
     result_df = result_df.replace({'class': {3: 2}})
     result_df = result_df.drop(result_df[result_df['class'] == 4].index).reset_index(drop=True)
 
     return result_df
+
+
+def classify_values(results, output_name=CLASSIFIED_NAME):
+    result_df = replace_class(pd.concat(results, ignore_index=True))
+    result_df.to_csv(output_name, index=False)
+    return result_df
+
+
+def read_photo_stream(stream_path):
+    # JSON lines with the filename, the severity class and the coordinates of each photo, "-" reads from stdin.
+    f = sys.stdin if stream_path == "-" else open(stream_path, encoding="utf-8")
+    try:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+
+            # A malformed line of a live stream is skipped instead of ending the stream.
+            try:
+                photo = json.loads(line)
+            except ValueError as e:
+                print("Skipping line {} of {}: {}".format(number, stream_path, e), file=sys.stderr)
+                continue
+            if not isinstance(photo, dict):
+                print("Skipping line {} of {}: not a JSON object".format(number, stream_path), file=sys.stderr)
+                continue
+            yield photo
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def geocode_photo(photo):
+    longitude, latitude = photo.get('longitude'), photo.get('latitude')
+    if longitude is None or latitude is None:
+        return None
+
+    photo['longitude'], photo['latitude'] = float(longitude), float(latitude)
+    photo['longitude_converted'], photo['latitude_converted'] = round_coordinates(photo['longitude'],
+                                                                                  photo['latitude'])
+    return photo
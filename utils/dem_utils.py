@@ -1,8 +1,24 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
 import gdal
 import gdalconst
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.trace_utils import stage, count
+
+
+class DownloadError(RuntimeError):
+    pass
+
+
+class TileNotFoundError(RuntimeError):
+    pass
 
 
 class Quadrant(Enum):
@@ -23,29 +39,182 @@ class Position(Enum):
     bottom_right = 8
 
 
-def make_request_dsm(latitude, longitude):
+TILE_SIZE = 3600
+UPSAMPLE_FACTOR = 3
+# Source pixels kept around the photos when upsampling a window: the largest neighborhood (6 upsampled pixels)
+# plus the support of the cubic spline kernel, with some slack so the window edges never reach the features.
+UPSAMPLE_MARGIN = 8
+
+SRTM_PATH = "./dems/srtm30_merged.tif"
+EU_DEM_PATH = "./dems/eu_dem.tif"
+
+_dsm_url = "https://cloud.sdsc.edu/v1/AUTH_opentopography/Raster/AW3D30/AW3D30_alos"
+_download_options = {'timeout': 60, 'retries': 3, 'backoff': 0.5, 'concurrency': 4}
+_tile_cache = None
+_tile_store = None
+_tile_index = None
+_session = None
+_executor = None
+_fallback_dems = {}
+
+
+def get_tile_cache():
+    return _tile_cache
+
+
+def set_tile_cache(tile_cache):
+    global _tile_cache
+    _tile_cache = tile_cache
+
+
+def get_tile_store():
+    return _tile_store
+
+
+def set_tile_store(tile_store):
+    global _tile_store
+    _tile_store = tile_store
+
+
+def get_tile_index():
+    return _tile_index
+
+
+def set_tile_index(tile_index):
+    global _tile_index
+    _tile_index = tile_index
+
+
+def get_dem_version(*options):
+    inputs = [_dsm_url, UPSAMPLE_FACTOR, UPSAMPLE_MARGIN] + list(options)
+    for path in (SRTM_PATH, EU_DEM_PATH):
+        stat = os.stat(path) if os.path.exists(path) else None
+        inputs.append((os.path.abspath(path), stat.st_size, stat.st_mtime) if stat else (path, None, None))
+    return hashlib.sha1(repr(inputs).encode("utf-8")).hexdigest()
+
+
+def get_download_options():
+    return dict(_download_options, url=_dsm_url)
+
+
+def configure_downloads(url=None, **options):
+    global _dsm_url, _session, _executor
+    if url is not None:
+        _dsm_url = url.rstrip("/")
+    _download_options.update(options)
+    _session, _executor = None, None
+
+
+def get_session():
+    global _session
+    if _session is None:
+        retries = Retry(total=_download_options['retries'], backoff_factor=_download_options['backoff'],
+                        status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_download_options['concurrency'], max_retries=retries)
+        _session = requests.Session()
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(_download_options['concurrency'])
+    return _executor
+
+
+def get_dsm_url(latitude, longitude):
     numbers_latitude = int(latitude[1:])
     letter_latitude = str(latitude[0])
 
     if letter_latitude == "N":
         if numbers_latitude <= 45:
-            template = "https://cloud.sdsc.edu/v1/AUTH_opentopography/Raster/AW3D30/AW3D30_alos/North/North_0_45/{}"
+            template = _dsm_url + "/North/North_0_45/{}"
         else:
-            template = "https://cloud.sdsc.edu/v1/AUTH_opentopography/Raster/AW3D30/AW3D30_alos/North/North_46_90/{}"
+            template = _dsm_url + "/North/North_46_90/{}"
     else:
-        template = "https://cloud.sdsc.edu/v1/AUTH_opentopography/Raster/AW3D30/AW3D30_alos/South/{}"
+        template = _dsm_url + "/South/{}"
 
     file_name = "{}{}_AVE_DSM.tif".format(latitude, longitude)
-    template = template.format(file_name)
-    return requests.get(template)
+    return template.format(file_name)
+
+
+def make_request_dsm(latitude, longitude):
+    return get_session().get(get_dsm_url(latitude, longitude), timeout=_download_options['timeout'])
+
+
+def download_dsm(latitude, longitude):
+    try:
+        with stage("download"):
+            response = make_request_dsm(latitude, longitude)
+    except requests.RequestException as e:
+        raise DownloadError("Could not download tile {}{} ({}).".format(latitude, longitude, e))
+
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise DownloadError("Could not download tile {}{} (HTTP {}).".format(latitude, longitude,
+                                                                            response.status_code))
+
+    count("bytes_downloaded", len(response.content))
+    return response.content
+
+
+def fetch_dsm(latitude, longitude, filename):
+    if _tile_store is not None:
+        path = _tile_store.lookup(latitude + longitude)
+        if path is not None:
+            return path
+
+    path = download_dsm_file(latitude, longitude, filename)
+
+    # Tiles are converted as they are fetched, so every mosaic is built from tiles of the same type.
+    if path is not None and _tile_store is not None:
+        _tile_store.import_tile(latitude + longitude, path)
+        return _tile_store.vrt_path(latitude + longitude)
+    return path
+
+
+def download_dsm_file(latitude, longitude, filename):
+    if _tile_cache is not None:
+        return _tile_cache.get(latitude + longitude, lambda: download_dsm(latitude, longitude))
+
+    content = download_dsm(latitude, longitude)
+    if content is None:
+        return None
+
+    gdal.FileFromMemBuffer(filename, content)
+    return filename
+
+
+def fetch_dsm_many(tiles, filenames, required=0):
+    futures = [get_executor().submit(fetch_dsm, tile[0], tile[1], filename)
+               for tile, filename in zip(tiles, filenames)]
+
+    # Errors of the first required tiles are raised, the other tiles are left out of the mosaic.
+    paths = []
+    for index, future in enumerate(futures):
+        try:
+            paths.append(future.result())
+        except RuntimeError:
+            if index < required:
+                raise
+            paths.append(None)
+    return paths
+
 
+def open_fetched_dsm(tile, path):
+    if path is None:
+        raise TileNotFoundError("Tile {}{} is not available.".format(tile[0], tile[1]))
+    return gdal.Open(path, gdalconst.GA_ReadOnly)
 
-def read_request(request, filename):
-    gdal.FileFromMemBuffer(filename, request.content)
-    return gdal.Open(filename, gdalconst.GA_ReadOnly)
 
+def open_dsm(latitude, longitude, filename):
+    return open_fetched_dsm((latitude, longitude), fetch_dsm(latitude, longitude, filename))
 
-def get_geotiff_info(gdal_dataset):
+
+def get_geotiff_metadata(gdal_dataset):
     image = gdal_dataset.GetRasterBand(1)
     no_data_value = image.GetNoDataValue()
 
@@ -56,27 +225,43 @@ def get_geotiff_info(gdal_dataset):
     x_origin, y_origin = transform[0], transform[3]
     pixel_width, pixel_height = transform[1], -transform[5]
 
-    data = image.ReadAsArray(0, 0, cols, rows)
+    return x_origin, y_origin, pixel_width, pixel_height, no_data_value, (rows, cols)
 
-    return x_origin, y_origin, pixel_width, pixel_height, no_data_value, data
 
+def read_window(gdal_dataset, points, radius):
+    rows, cols = gdal_dataset.RasterYSize, gdal_dataset.RasterXSize
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
 
-def find_quadrant(point, dsm_content):
-    dsm_info = get_geotiff_info(dsm_content)
+    row_start = min(max(points[:, 0].min() - radius, 0), rows)
+    col_start = min(max(points[:, 1].min() - radius, 0), cols)
+    row_end = max(min(points[:, 0].max() + radius + 1, rows), row_start)
+    col_end = max(min(points[:, 1].max() + radius + 1, cols), col_start)
+
+    if row_end == row_start or col_end == col_start:
+        data = np.empty((row_end - row_start, col_end - col_start), dtype=np.float32)
+    else:
+        data = gdal_dataset.GetRasterBand(1).ReadAsArray(int(col_start), int(row_start), int(col_end - col_start),
+                                                         int(row_end - row_start))
 
-    if point[0] <= (dsm_info[-1].shape[0] / 2) and point[1] >= (dsm_info[-1].shape[1] / 2):
+    return data, points - [row_start, col_start]
+
+
+def find_point_quadrant(point, shape):
+    if point[0] <= (shape[0] / 2) and point[1] >= (shape[1] / 2):
         return Quadrant.first
-    if point[0] <= (dsm_info[-1].shape[0] / 2) and point[1] <= (dsm_info[-1].shape[1] / 2):
+    if point[0] <= (shape[0] / 2) and point[1] <= (shape[1] / 2):
         return Quadrant.second
-    if point[0] >= (dsm_info[-1].shape[0] / 2) and point[1] <= (dsm_info[-1].shape[1] / 2):
+    if point[0] >= (shape[0] / 2) and point[1] <= (shape[1] / 2):
         return Quadrant.third
-    if point[0] >= (dsm_info[-1].shape[0] / 2) and point[1] >= (dsm_info[-1].shape[1] / 2):
+    if point[0] >= (shape[0] / 2) and point[1] >= (shape[1] / 2):
         return Quadrant.fourth
 
 
-def calculate_positions_needed(point, dsm_content):
-    quadrant = find_quadrant(point, dsm_content)
+def find_quadrant(point, dsm_content):
+    return find_point_quadrant(point, get_geotiff_metadata(dsm_content)[-1])
+
 
+def calculate_quadrant_positions(quadrant):
     if quadrant == Quadrant.first:
         return [Position.right, Position.top_right, Position.top]
     if quadrant == Quadrant.second:
@@ -87,6 +272,10 @@ def calculate_positions_needed(point, dsm_content):
         return [Position.bottom, Position.bottom_right, Position.right]
 
 
+def calculate_positions_needed(point, dsm_content):
+    return calculate_quadrant_positions(find_quadrant(point, dsm_content))
+
+
 def handle_right(letter_longitude, numbers_longitude, latitude):
     if letter_longitude == "W":
         if numbers_longitude == 1:
@@ -95,8 +284,10 @@ def handle_right(letter_longitude, numbers_longitude, latitude):
             new_number = str(numbers_longitude - 1).zfill(3)
             return latitude, "W{}".format(new_number)
     if letter_longitude == "E":
-        if numbers_longitude == 180:
-            raise ValueError("I dont't know...")
+        if numbers_longitude >= 179:
+            # Across the antimeridian E179 is followed by W180.
+            new_number = str(359 - numbers_longitude).zfill(3)
+            return latitude, "W{}".format(new_number)
         else:
             new_number = str(numbers_longitude + 1).zfill(3)
             return latitude, "E{}".format(new_number)
@@ -110,8 +301,9 @@ def handle_top(letter_latitude, numbers_latitude, longitude):
             new_number = str(numbers_latitude - 1).zfill(3)
             return "S{}".format(new_number), longitude
     if letter_latitude == "N":
-        if numbers_latitude == 90:
-            raise ValueError("I don't know...")
+        if numbers_latitude >= 89:
+            # There are no tiles beyond the north pole.
+            return None
         else:
             new_number = str(numbers_latitude + 1).zfill(3)
             return "N{}".format(new_number), longitude
@@ -120,7 +312,8 @@ def handle_top(letter_latitude, numbers_latitude, longitude):
 def handle_left(letter_longitude, numbers_longitude, latitude):
     if letter_longitude == "W":
         if numbers_longitude == 180:
-            raise ValueError("I dont't know...")
+            # Across the antimeridian W180 is preceded by E179.
+            return latitude, "E179"
         else:
             new_number = str(numbers_longitude + 1).zfill(3)
             return latitude, "W{}".format(new_number)
@@ -134,8 +327,9 @@ def handle_left(letter_longitude, numbers_longitude, latitude):
 
 def handle_bottom(letter_latitude, numbers_latitude, longitude):
     if letter_latitude == "S":
-        if numbers_latitude == 90:
-            raise ValueError("I dont't know...")
+        if numbers_latitude >= 90:
+            # There are no tiles beyond the south pole.
+            return None
         else:
             new_number = str(numbers_latitude + 1).zfill(3)
             return "S{}".format(new_number), longitude
@@ -154,14 +348,20 @@ def get_position_in_raster(longitude, latitude, info_raster):
     return row_np, col_np
 
 
-def merge_dsm(row, dsm_content, filename):
-    longitude, latitude = row['longitude'], row['latitude']
-    dsm_info = get_geotiff_info(dsm_content)
-    point = get_position_in_raster(longitude, latitude, dsm_info)
+def get_tile_origin(latitude, longitude):
+    x_origin = int(longitude[1:]) if longitude[0] == "E" else -int(longitude[1:])
+    y_origin = int(latitude[1:]) + 1 if latitude[0] == "N" else 1 - int(latitude[1:])
+    return x_origin, y_origin
 
-    longitude, latitude = row['longitude_converted'], row['latitude_converted']
-    positions = calculate_positions_needed(point, dsm_content)
 
+def predict_quadrant(row):
+    x_origin, y_origin = get_tile_origin(row['latitude_converted'], row['longitude_converted'])
+    info = (x_origin, y_origin, 1 / TILE_SIZE, 1 / TILE_SIZE)
+    point = get_position_in_raster(row['longitude'], row['latitude'], info)
+    return find_point_quadrant(point, (TILE_SIZE, TILE_SIZE))
+
+
+def find_neighbor_tiles(latitude, longitude, positions):
     numbers_longitude = int(longitude[1:])
     numbers_latitude = int(latitude[1:])
 
@@ -173,58 +373,191 @@ def merge_dsm(row, dsm_content, filename):
         if position == Position.right:
             to_fill.append(handle_right(letter_longitude, numbers_longitude, latitude))
         if position == Position.top_right:
-            result_right = handle_right(letter_longitude, numbers_longitude, latitude)
-            result_top = handle_top(letter_latitude, numbers_latitude, longitude)
-            to_fill.append((result_top[0], result_right[1]))
+            to_fill.append(combine_corner(handle_top(letter_latitude, numbers_latitude, longitude),
+                                          handle_right(letter_longitude, numbers_longitude, latitude)))
         if position == Position.top:
             to_fill.append(handle_top(letter_latitude, numbers_latitude, longitude))
         if position == Position.top_left:
-            result_left = handle_left(letter_longitude, numbers_longitude, latitude)
-            result_top = handle_top(letter_latitude, numbers_latitude, longitude)
-            to_fill.append((result_top[0], result_left[1]))
+            to_fill.append(combine_corner(handle_top(letter_latitude, numbers_latitude, longitude),
+                                          handle_left(letter_longitude, numbers_longitude, latitude)))
         if position == Position.left:
             to_fill.append(handle_left(letter_longitude, numbers_longitude, latitude))
         if position == Position.bottom_left:
-            result_left = handle_left(letter_longitude, numbers_longitude, latitude)
-            result_bottom = handle_bottom(letter_latitude, numbers_latitude, longitude)
-            to_fill.append((result_bottom[0], result_left[1]))
+            to_fill.append(combine_corner(handle_bottom(letter_latitude, numbers_latitude, longitude),
+                                          handle_left(letter_longitude, numbers_longitude, latitude)))
         if position == Position.bottom:
             to_fill.append(handle_bottom(letter_latitude, numbers_latitude, longitude))
         if position == Position.bottom_right:
-            result_right = handle_right(letter_longitude, numbers_longitude, latitude)
-            result_bottom = handle_bottom(letter_latitude, numbers_latitude, longitude)
-            to_fill.append((result_bottom[0], result_right[1]))
+            to_fill.append(combine_corner(handle_bottom(letter_latitude, numbers_latitude, longitude),
+                                          handle_right(letter_longitude, numbers_longitude, latitude)))
+
+    return [tile for tile in to_fill if tile is not None]
+
+
+def combine_corner(vertical, horizontal):
+    if vertical is None or horizontal is None:
+        return None
+    return vertical[0], horizontal[1]
+
+
+def get_mosaic_tiles(row, positions=None):
+    latitude, longitude = row['latitude_converted'], row['longitude_converted']
+    if positions is None:
+        positions = calculate_quadrant_positions(predict_quadrant(row))
+
+    return [(latitude, longitude)] + find_neighbor_tiles(latitude, longitude, positions)
+
+
+def is_indexed(tiles):
+    # The center tile must be indexed, neighbors may also be known to be missing.
+    if _tile_index is None or tiles[0][0] + tiles[0][1] not in _tile_index.names:
+        return False
+
+    for latitude, longitude in tiles[1:]:
+        name = latitude + longitude
+        if name not in _tile_index.names and (_tile_cache is None or not _tile_cache.is_missing(name)):
+            return False
+    return True
 
-    names = []
-    for index, item in enumerate(to_fill):
-        try:
-            name = "/vsimem/dsm{}".format(index)
-            read_request(make_request_dsm(item[0], item[1]), name)
-            names.append(name)
-        except RuntimeError:
-            pass
 
-    content = gdal.BuildVRT("/vsimem/vrt", names + ["/vsimem/dsm"], VRTNodata=-9999)
-    final_content = gdal.Translate(filename, content)
+def shift_tile(path, offset, filename):
+    dataset = gdal.Open(path, gdalconst.GA_ReadOnly)
+    transform = dataset.GetGeoTransform()
+    upper_left_x, upper_left_y = transform[0] + offset, transform[3]
+    lower_right_x = upper_left_x + dataset.RasterXSize * transform[1]
+    lower_right_y = upper_left_y + dataset.RasterYSize * transform[5]
+    gdal.Translate(filename, dataset, format="VRT", outputBounds=[upper_left_x, upper_left_y, lower_right_x,
+                                                                  lower_right_y])
+    return filename
 
-    for name in names:
-        gdal.Unlink(name)
+
+def wrap_antimeridian(dsm_content, paths, filename):
+    x_origin = dsm_content.GetGeoTransform()[0]
+    if -179 < x_origin < 179:
+        return paths
+
+    # Neighbors on the other side of the antimeridian are moved next to the center tile with a virtual copy.
+    wrapped = []
+    for index, path in enumerate(paths):
+        offset = 360 * round((x_origin - gdal.Open(path, gdalconst.GA_ReadOnly).GetGeoTransform()[0]) / 360)
+        wrapped.append(path if offset == 0 else shift_tile(path, offset, "{}_wrapped_{}.vrt".format(filename, index)))
+    return wrapped
+
+
+def fetch_mosaic_tiles(row, prefix):
+    tiles = get_mosaic_tiles(row)
+    filenames = ["{}/dsm_{}".format(prefix, index) for index in range(len(tiles))]
+    with stage("fetch"):
+        paths = fetch_dsm_many(tiles, filenames, required=1)
+
+    return open_fetched_dsm(tiles[0], paths[0]), [path for path in paths[1:] if path is not None]
+
+
+def merge_dsm(row, dsm_content, filename, neighbors=None):
+    if neighbors is None:
+        longitude, latitude = row['longitude'], row['latitude']
+        dsm_info = get_geotiff_metadata(dsm_content)
+        point = get_position_in_raster(longitude, latitude, dsm_info)
+
+        longitude, latitude = row['longitude_converted'], row['latitude_converted']
+        to_fill = find_neighbor_tiles(latitude, longitude, calculate_positions_needed(point, dsm_content))
+        filenames = ["{}_{}".format(filename, index) for index in range(len(to_fill))]
+        with stage("fetch"):
+            neighbors = [path for path in fetch_dsm_many(to_fill, filenames) if path is not None]
+
+    with stage("merge"):
+        sources = wrap_antimeridian(dsm_content, neighbors, filename) + [dsm_content.GetDescription()]
+        content = gdal.BuildVRT(filename + "_vrt", sources, VRTNodata=-9999)
+        final_content = gdal.Translate(filename, content)
+        gdal.Unlink(filename + "_vrt")
+
+    for name in set(neighbors + sources[:-1]):
+        if name.startswith("/vsimem/"):
+            gdal.Unlink(name)
 
     return final_content
 
 
+def get_points_window(dsm_content, coordinates, margin=UPSAMPLE_MARGIN):
+    dsm_info = get_geotiff_metadata(dsm_content)
+    rows, cols = dsm_info[-1]
+    points = np.array([get_position_in_raster(longitude, latitude, dsm_info) for longitude, latitude in coordinates])
+
+    row_start = int(min(max(points[:, 0].min() - margin, 0), rows - 1))
+    col_start = int(min(max(points[:, 1].min() - margin, 0), cols - 1))
+    row_end = int(max(min(points[:, 0].max() + margin + 1, rows), row_start + 1))
+    col_end = int(max(min(points[:, 1].max() + margin + 1, cols), col_start + 1))
+
+    return col_start, row_start, col_end - col_start, row_end - row_start
+
+
+def clip_dsm(dsm_content, filename, window):
+    with stage("clip"):
+        return gdal.Translate(filename, dsm_content, srcWin=list(window))
+
+
+def upsample_dsm(dsm_content, filename):
+    # Filled mosaics are Float32, mosaics without any nodata keep the Int16 type of the tiles.
+    with stage("upsample"):
+        return gdal.Translate(filename, dsm_content, format="GTiff", widthPct=100 * UPSAMPLE_FACTOR,
+                              heightPct=100 * UPSAMPLE_FACTOR, outputType=gdalconst.GDT_Float32,
+                              resampleAlg=gdalconst.GRA_CubicSpline)
+
+
+def open_fallback_dem(path):
+    # Datasets are not shared with forked workers, each process opens its own handle.
+    key = (os.getpid(), path)
+    if key not in _fallback_dems:
+        _fallback_dems[key] = gdal.Open(path, gdalconst.GA_ReadOnly)
+    return _fallback_dems[key]
+
+
+def find_no_data_window(dsm_content, block_size=1024):
+    band = dsm_content.GetRasterBand(1)
+    no_data_value = band.GetNoDataValue()
+    if no_data_value is None:
+        return None
+
+    cols, rows = dsm_content.RasterXSize, dsm_content.RasterYSize
+    missing_rows, missing_cols = [], np.zeros(cols, dtype=bool)
+    for row_start in range(0, rows, block_size):
+        missing = band.ReadAsArray(0, row_start, cols, min(block_size, rows - row_start)) == no_data_value
+        missing_rows.extend(np.flatnonzero(missing.any(axis=1)) + row_start)
+        missing_cols |= missing.any(axis=0)
+
+    if not missing_rows:
+        return None
+
+    missing_cols = np.flatnonzero(missing_cols)
+    return (int(missing_cols[0]), int(missing_rows[0]), int(missing_cols[-1] - missing_cols[0] + 1),
+            int(missing_rows[-1] - missing_rows[0] + 1))
+
+
 def fill_no_data(dsm_content, filename):
-    file_srtm = gdal.Open("./dems/srtm30_merged.tif")
-    interpolated = interpolate(file_srtm, dsm_content, "/vsimem/lowest_res")
-    file_eu_dem = gdal.Open("./dems/eu_dem.tif")
-    interpolated_eu_dem = interpolate(file_eu_dem, dsm_content, "/vsimem/eu_dem")
-    content = gdal.Warp(filename, [interpolated, interpolated_eu_dem, dsm_content])
-    gdal.Unlink("/vsimem/lowest_res")
-    gdal.Unlink("/vsimem/eu_dem")
+    with stage("find_no_data"):
+        window = find_no_data_window(dsm_content)
+    if window is None:
+        count("fill_skipped")
+        return dsm_content
+
+    with stage("interpolate"):
+        interpolated = interpolate(open_fallback_dem(SRTM_PATH), dsm_content, filename + "_srtm", window)
+        interpolated_eu_dem = interpolate(open_fallback_dem(EU_DEM_PATH), dsm_content, filename + "_eu_dem",
+                                          window)
+
+    transform = dsm_content.GetGeoTransform()
+    cols, rows = dsm_content.RasterXSize, dsm_content.RasterYSize
+    bounds = [transform[0], transform[3] + rows * transform[5], transform[0] + cols * transform[1], transform[3]]
+    with stage("fill"):
+        content = gdal.Warp(filename, [interpolated, interpolated_eu_dem, dsm_content], outputBounds=bounds,
+                            width=cols, height=rows)
+
+    gdal.Unlink(filename + "_srtm")
+    gdal.Unlink(filename + "_eu_dem")
     return content
 
 
-def interpolate(src_content, reference_content, output_filename):
+def interpolate(src_content, reference_content, output_filename, window=None):
     src_proj = src_content.GetProjection()
 
     reference_proj = reference_content.GetProjection()
@@ -232,6 +565,11 @@ def interpolate(src_content, reference_content, output_filename):
     x = reference_content.RasterXSize
     y = reference_content.RasterYSize
 
+    if window is not None:
+        x_offset, y_offset, x, y = window
+        reference_trans = (reference_trans[0] + x_offset * reference_trans[1], reference_trans[1], reference_trans[2],
+                           reference_trans[3] + y_offset * reference_trans[5], reference_trans[4], reference_trans[5])
+
     driver = gdal.GetDriverByName('GTiff')
     output = driver.Create(output_filename, x, y, 1, gdalconst.GDT_Float32)
     band = output.GetRasterBand(1)
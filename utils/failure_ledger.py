@@ -0,0 +1,137 @@
+import json
+import os
+import time
+from collections import Counter
+
+from utils.dem_utils import DownloadError, TileNotFoundError
+from utils.result_utils import truncate_partial_line
+
+# Failures of the current process not yet written to the ledger, None while they are not recorded.
+_failures = None
+
+
+def start_recording():
+    global _failures
+    if _failures is None:
+        _failures = []
+
+
+def is_recording():
+    return _failures is not None
+
+
+def describe_failure(filename, exception):
+    if isinstance(exception, TileNotFoundError):
+        reason, permanent, default_stage = "tile_not_found", True, "fetch"
+    elif isinstance(exception, DownloadError):
+        reason, permanent, default_stage = "download_error", False, "download"
+    elif isinstance(exception, RuntimeError):
+        # GDAL errors also come from evicted or concurrently written files, so only missing tiles are permanent.
+        reason, permanent, default_stage = "gdal_error", False, "estimate"
+    else:
+        reason, permanent, default_stage = type(exception).__name__, False, "estimate"
+
+    return {'filename': str(filename), 'reason': reason, 'stage': getattr(exception, "stage", None) or default_stage,
+            'message': str(exception), 'permanent': permanent}
+
+
+def record_failure(filename, exception):
+    if _failures is not None:
+        _failures.append(describe_failure(filename, exception))
+
+
+def record_duplicate_failure(filename, duplicate_filename):
+    if _failures is None:
+        return
+
+    for failure in reversed(_failures):
+        if failure['filename'] == str(filename):
+            _failures.append(dict(failure, filename=str(duplicate_filename)))
+            return
+
+
+def add_failures(failures):
+    if _failures is not None:
+        _failures.extend(failures)
+
+
+def pop_failures():
+    global _failures
+    if _failures is None:
+        return []
+
+    failures, _failures = _failures, []
+    return failures
+
+
+class FailureLedger:
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        self.failures = {}
+        self.failed = Counter()
+        self.skipped = Counter()
+
+        if os.path.isfile(path):
+            truncate_partial_line(path)
+            with open(path) as f:
+                for line in f:
+                    record = json.loads(line)
+                    # Failures with other DEM inputs may succeed now, they are retried.
+                    if record['dem_version'] != version:
+                        continue
+                    if record.get('resolved'):
+                        self.failures.pop(record['filename'], None)
+                    else:
+                        self.failures[record['filename']] = record
+
+        self.file = open(path, "a")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def skip(self, filenames, retry_permanent=False):
+        skipped = []
+        for filename in filenames:
+            failure = self.failures.get(str(filename))
+            if failure is not None and failure['permanent'] and not retry_permanent:
+                self.skipped[failure['reason']] += 1
+                skipped.append(True)
+            else:
+                skipped.append(False)
+        return skipped
+
+    def record(self, failure):
+        record = dict(failure, dem_version=self.version, time=time.time())
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        self.failures[record['filename']] = record
+        self.failed[record['reason']] += 1
+
+    def resolve(self, filename):
+        if str(filename) in self.failures:
+            del self.failures[str(filename)]
+            self.file.write(json.dumps({'filename': str(filename), 'dem_version': self.version,
+                                        'resolved': True}) + "\n")
+            self.file.flush()
+
+    def summary(self):
+        return {'failed': dict(self.failed), 'skipped': dict(self.skipped)}
+
+    def close(self):
+        self.file.close()
+
+
+def print_failure_summary(summary):
+    reasons = sorted(set(summary['failed']) | set(summary['skipped']))
+    if not reasons:
+        return
+
+    print("{:<20}: {:>10} {:>10}".format("Failure reason", "failed", "skipped"))
+    for reason in reasons:
+        print("{:<20}: {:10d} {:10d}".format(reason, summary['failed'].get(reason, 0),
+                                             summary['skipped'].get(reason, 0)))
@@ -0,0 +1,55 @@
+import json
+import sqlite3
+
+from utils.neighborhood_utils import RADII
+
+
+class FeatureStore:
+
+    def __init__(self, path, version, radii=RADII, precision=6, commit_interval=100):
+        self.version = "{}|radii={}".format(version, ",".join(str(radius) for radius in radii))
+        self.precision = precision
+        self.commit_interval = commit_interval
+        self.uncommitted = 0
+
+        # The connection may be used from the threads of the service, which serializes the accesses.
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS features "
+                                "(key TEXT NOT NULL, version TEXT NOT NULL, features TEXT NOT NULL, "
+                                "PRIMARY KEY (key, version))")
+        # Features computed from other DEM inputs or radii can never be hit again.
+        self.connection.execute("DELETE FROM features WHERE version != ?", (self.version,))
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def key(self, longitude, latitude):
+        return "{:.{precision}f},{:.{precision}f}".format(longitude, latitude, precision=self.precision)
+
+    def get_many(self, keys):
+        keys, stored = list(keys), {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            query = "SELECT key, features FROM features WHERE version = ? AND key IN ({})".format(
+                ",".join("?" * len(chunk)))
+            for key, features in self.connection.execute(query, [self.version] + chunk):
+                stored[key] = json.loads(features)
+        return stored
+
+    def put(self, key, features):
+        self.connection.execute("INSERT OR REPLACE INTO features (key, version, features) VALUES (?, ?, ?)",
+                                (key, self.version, json.dumps({name: float(value)
+                                                                for name, value in features.items()})))
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_interval:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
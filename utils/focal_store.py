@@ -0,0 +1,103 @@
+import glob
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils.dem_utils import UPSAMPLE_FACTOR, UPSAMPLE_MARGIN, get_geotiff_metadata, get_position_in_raster, \
+    get_points_window
+from utils.neighborhood_utils import RADII, focal_statistics, get_feature_names
+from utils.trace_utils import stage, count
+
+# Upsampled pixels kept around the photos of a group, so later photos close to them are also a lookup.
+FOCAL_MARGIN = 150
+# Largest window computed at once, about 300 MB of features. Groups spread further apart are computed per photo.
+FOCAL_MAX_PIXELS = 2048 * 2048
+# Part of the version of the rasters, increased when the layout or the valid region of the rasters changes.
+FOCAL_FORMAT = 2
+
+
+class FocalStore:
+
+    def __init__(self, directory, version, radii=RADII, margin=FOCAL_MARGIN, max_pixels=FOCAL_MAX_PIXELS):
+        self.directory = directory
+        self.version = "{}|radii={}|format={}".format(version, ",".join(str(radius) for radius in radii),
+                                                     FOCAL_FORMAT)
+        self.radii = radii
+        self.margin = margin
+        self.max_pixels = max_pixels
+        self.names = get_feature_names(radii)
+        self.entries = {}
+        self.arrays = {}
+        os.makedirs(directory, exist_ok=True)
+
+        for metadata_path in glob.glob(os.path.join(directory, "*.json")):
+            with open(metadata_path) as f:
+                metadata = json.load(f)
+
+            # Rasters computed from other DEM inputs or radii can never be hit again.
+            if metadata['version'] != self.version:
+                os.remove(metadata_path)
+                if os.path.exists(metadata['path']):
+                    os.remove(metadata['path'])
+                continue
+            self.entries.setdefault(metadata['tile'], []).append(metadata)
+
+    def __getstate__(self):
+        # Worker processes map the rasters themselves instead of receiving copies of the arrays.
+        return dict(self.__dict__, arrays={})
+
+    def lookup(self, tile, longitude, latitude):
+        for metadata in self.entries.get(tile, []):
+            row, col = get_position_in_raster(longitude, latitude, metadata['info'])
+            row_start, col_start, row_end, col_end = metadata['valid']
+            if row_start <= row < row_end and col_start <= col < col_end:
+                if metadata['path'] not in self.arrays:
+                    self.arrays[metadata['path']] = np.load(metadata['path'], mmap_mode="r")
+                values = self.arrays[metadata['path']][:, row - metadata['offset'][0], col - metadata['offset'][1]]
+                count("focal_hits")
+                return dict(zip(self.names, (float(value) for value in values)))
+
+        count("focal_misses")
+        return None
+
+    def build(self, tile, dsm_content, coordinates, clipped=False):
+        dsm_info = get_geotiff_metadata(dsm_content)
+        rows, cols = dsm_info[-1]
+        radius = max(self.radii)
+        col_start, row_start, width, height = get_points_window(dsm_content, coordinates, self.margin + radius)
+        if width * height > self.max_pixels:
+            count("focal_skipped")
+            return False
+
+        with stage("focal"):
+            data = dsm_content.GetRasterBand(1).ReadAsArray(col_start, row_start, width, height)
+
+            name = "{}_{}_{}_{}_{}".format(tile, row_start, col_start, height, width)
+            path = os.path.join(self.directory, name + ".npy")
+            temporary_path = "{}.{}.{}.tmp.npy".format(path[:-4], os.getpid(), threading.get_ident())
+            out = np.lib.format.open_memmap(temporary_path, mode="w+", dtype=np.float32,
+                                            shape=(len(self.names), height, width))
+            focal_statistics(data, self.radii, dsm_info[4], out=out)
+            out.flush()
+            del out
+            os.replace(temporary_path, path)
+
+        # Pixels whose neighborhood crosses the edge of the window would miss neighbors the full raster has, and the
+        # edge of a mosaic is not the edge of the DEM, the mosaics of other quadrants extend past it. Clipped inputs
+        # are also distorted by the upsampling near their edges, up to the margin kept around the photos.
+        edge = max(radius, UPSAMPLE_MARGIN * UPSAMPLE_FACTOR) if clipped else radius
+        metadata = {
+            'version': self.version, 'tile': tile, 'path': path, 'info': list(dsm_info[:4]),
+            'offset': [row_start, col_start],
+            'valid': [max(row_start + radius, edge), max(col_start + radius, edge),
+                      min(row_start + height - radius, rows - edge), min(col_start + width - radius, cols - edge)],
+        }
+        temporary_path = "{}.{}.{}.tmp".format(path[:-4], os.getpid(), threading.get_ident())
+        with open(temporary_path, "w") as f:
+            json.dump(metadata, f)
+        os.replace(temporary_path, path[:-4] + ".json")
+
+        self.entries.setdefault(tile, []).append(metadata)
+        return True
@@ -0,0 +1,132 @@
+import numpy as np
+
+RADII = [1, 2, 3, 4, 5, 6]
+
+NEIGHBORHOOD_NAMES = {1: "eight_neighbors", 2: "twenty_four_neighbors", 3: "forty_eight_neighbors",
+                      4: "eighty_neighbors", 5: "one_hundred_twenty_neighbors",
+                      6: "one_hundred_sixty_eight_neighbors"}
+
+STATISTICS = ["avg", "min", "max"]
+
+
+def get_feature_names(radii=RADII):
+    return ["{}_{}".format(NEIGHBORHOOD_NAMES[radius], statistic) for radius in radii for statistic in STATISTICS]
+
+
+def extract_windows(data, points, radius, no_data_value=None):
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    offsets = np.arange(-radius, radius + 1)
+
+    rows = points[:, 0, None, None] + offsets[None, :, None]
+    cols = points[:, 1, None, None] + offsets[None, None, :]
+    inside = (rows >= 0) & (rows < data.shape[0]) & (cols >= 0) & (cols < data.shape[1])
+
+    dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+    if data.size == 0:
+        return np.full(inside.shape, np.nan, dtype=dtype)
+
+    windows = data[np.clip(rows, 0, data.shape[0] - 1), np.clip(cols, 0, data.shape[1] - 1)].astype(dtype)
+
+    # Pixels outside the raster or without data are not neighbors, instead of wrapping around or counting -9999.
+    windows[~inside] = np.nan
+    if no_data_value is not None:
+        windows[windows == no_data_value] = np.nan
+
+    return windows
+
+
+def neighborhood_statistics(windows, radii=RADII):
+    radius = windows.shape[-1] // 2
+    if max(radii) > radius:
+        raise ValueError("Windows of radius {} are too small for radius {}.".format(radius, max(radii)))
+
+    center = windows[:, radius, radius]
+    differences = np.abs(windows - center[:, None, None])
+    valid = ~np.isnan(differences)
+
+    offsets = np.abs(np.arange(-radius, radius + 1))
+    rings = np.maximum(offsets[:, None], offsets[None, :])
+
+    sums, counts, minimums, maximums = [], [], [], []
+    for ring in range(1, radius + 1):
+        mask = (rings == ring)[None, :, :] & valid
+        sums.append(np.where(mask, differences, 0).sum(axis=(1, 2)))
+        counts.append(mask.sum(axis=(1, 2)))
+        minimums.append(np.where(mask, differences, np.inf).min(axis=(1, 2)))
+        maximums.append(np.where(mask, differences, -np.inf).max(axis=(1, 2)))
+
+    # Square neighborhoods are nested, so each radius accumulates the rings inside it.
+    sums = np.cumsum(sums, axis=0)
+    counts = np.cumsum(counts, axis=0)
+    minimums = np.minimum.accumulate(minimums, axis=0)
+    maximums = np.maximum.accumulate(maximums, axis=0)
+
+    index = np.asarray(radii) - 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        statistics = np.stack([sums[index] / counts[index], minimums[index], maximums[index]], axis=-1)
+    statistics[counts[index] == 0] = np.nan
+
+    return np.moveaxis(statistics, 0, 1)
+
+
+def compute_neighborhood_features(data, points, radii=RADII, no_data_value=None):
+    windows = extract_windows(data, points, max(radii), no_data_value)
+    statistics = neighborhood_statistics(windows, radii).reshape(windows.shape[0], -1)
+
+    names = get_feature_names(radii)
+    return [dict(zip(names, values)) for values in statistics]
+
+
+def focal_statistics(data, radii=RADII, no_data_value=None, out=None, chunk_rows=256):
+    # The features of every pixel of a raster at once, laid out as get_feature_names by rows and columns.
+    radius = max(radii)
+    rows, cols = data.shape
+    dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+    if out is None:
+        out = np.empty((len(radii) * len(STATISTICS), rows, cols), dtype=np.float32)
+
+    for start in range(0, rows, chunk_rows):
+        end = min(start + chunk_rows, rows)
+        height = end - start
+
+        # Pixels outside the raster or without data are not neighbors, as in extract_windows.
+        block = np.full((height + 2 * radius, cols + 2 * radius), np.nan, dtype=dtype)
+        first, last = max(start - radius, 0), min(end + radius, rows)
+        block[first - start + radius:last - start + radius, radius:radius + cols] = data[first:last]
+        if no_data_value is not None:
+            block[block == no_data_value] = np.nan
+        center = block[radius:radius + height, radius:radius + cols]
+
+        sums = np.zeros((radius, height, cols), dtype=dtype)
+        counts = np.zeros((radius, height, cols), dtype=np.int64)
+        minimums = np.full((radius, height, cols), np.inf, dtype=dtype)
+        maximums = np.full((radius, height, cols), -np.inf, dtype=dtype)
+        for row_offset in range(-radius, radius + 1):
+            for col_offset in range(-radius, radius + 1):
+                ring = max(abs(row_offset), abs(col_offset))
+                if ring == 0:
+                    continue
+
+                shifted = block[radius + row_offset:radius + row_offset + height,
+                                radius + col_offset:radius + col_offset + cols]
+                differences = np.abs(shifted - center)
+                valid = ~np.isnan(differences)
+                sums[ring - 1] += np.where(valid, differences, 0)
+                counts[ring - 1] += valid
+                np.fmin(minimums[ring - 1], differences, out=minimums[ring - 1])
+                np.fmax(maximums[ring - 1], differences, out=maximums[ring - 1])
+
+        sums = np.cumsum(sums, axis=0)
+        counts = np.cumsum(counts, axis=0)
+        minimums = np.minimum.accumulate(minimums, axis=0)
+        maximums = np.maximum.accumulate(maximums, axis=0)
+
+        for index, ring in enumerate(radii):
+            empty = counts[ring - 1] == 0
+            with np.errstate(invalid='ignore', divide='ignore'):
+                statistics = [sums[ring - 1] / counts[ring - 1], minimums[ring - 1], maximums[ring - 1]]
+            for offset, statistic in enumerate(statistics):
+                statistic[empty] = np.nan
+                out[index * len(STATISTICS) + offset, start:end] = statistic
+
+    return out
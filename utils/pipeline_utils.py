@@ -0,0 +1,60 @@
+import threading
+from queue import Queue
+
+_END = object()
+
+
+class StageError:
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def feed(source, output_queue):
+    try:
+        for item in source:
+            output_queue.put(item)
+    except Exception as e:
+        output_queue.put(StageError(e))
+    output_queue.put(_END)
+
+
+def run_stage(function, input_queue, output_queue, on_error=None):
+    while True:
+        item = input_queue.get()
+        if item is _END:
+            output_queue.put(_END)
+            return
+
+        if not isinstance(item, StageError):
+            try:
+                item = function(item)
+            except Exception as e:
+                # With an error handler, a failing item is reported and dropped and the stream goes on.
+                if on_error is None:
+                    item = StageError(e)
+                else:
+                    on_error(item, e)
+                    item = None
+
+        if item is not None:
+            output_queue.put(item)
+
+
+def stream(source, stages, queue_size=16, on_error=None):
+    queues = [Queue(queue_size) for _ in range(len(stages) + 1)]
+
+    threads = [threading.Thread(target=feed, args=(source, queues[0]), daemon=True)]
+    for index, function in enumerate(stages):
+        threads.append(threading.Thread(target=run_stage, args=(function, queues[index], queues[index + 1], on_error),
+                                        daemon=True))
+    for thread in threads:
+        thread.start()
+
+    while True:
+        item = queues[-1].get()
+        if item is _END:
+            return
+        if isinstance(item, StageError):
+            raise item.exception
+        yield item
@@ -1,46 +1,71 @@
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mticker
+import numpy as np
 import pandas as pd
 
 
-def draw_plot(result):
-    final_result = []
-    first, second = [], []
-    for index, row in result.iterrows():
+# Neighborhoods tried, in order, for photos of the "more than 1 meter" class until one spreads more than 1 meter.
+HEIGHT_NEIGHBORHOODS = ["twenty_four_neighbors", "forty_eight_neighbors", "eighty_neighbors",
+                        "one_hundred_twenty_neighbors", "one_hundred_sixty_eight_neighbors"]
+
+
+def compute_height(row):
+    if row['class'] == 1:
+        return row['eight_neighbors_avg'] - row['eight_neighbors_min']
+
+    elif row['class'] == 2:
+        for name in HEIGHT_NEIGHBORHOODS:
+            height = row[name + '_max'] - row[name + '_avg']
+            if height > 1:
+                break
+        return height
+
+    else:
+        raise ValueError("Class should be equal to 1 or 2.")
+
+
+def clamp_height(severity, height):
+    return min(1.0, height) if severity == 1 else max(1.0, height)
 
-        if row['class'] == 1:
-            height = row['eight_neighbors_avg'] - row['eight_neighbors_min']
-            first.append(height)
-            height = min(1.0, height)
 
-        elif row['class'] == 2:
-            height = row['twenty_four_neighbors_max'] - row['twenty_four_neighbors_avg']
-            height = height if height > 1 else row['forty_eight_neighbors_max'] - row['forty_eight_neighbors_avg']
-            height = height if height > 1 else row['eighty_neighbors_max'] - row['eighty_neighbors_avg']
-            height = height if height > 1 else row['one_hundred_twenty_neighbors_max'] - row['one_hundred_twenty_neighbors_avg']
-            height = height if height > 1 else row['one_hundred_sixty_eight_neighbors_max'] - row['one_hundred_sixty_eight_neighbors_avg']
-            second.append(height)
-            height = max(1.0, height)
+def compute_heights(result):
+    if not result['class'].isin([1, 2]).all():
+        raise ValueError("Class should be equal to 1 or 2.")
 
-        else:
-            raise ValueError("Class should be equal to 1 or 2.")
+    first = (result['eight_neighbors_avg'] - result['eight_neighbors_min']).to_numpy(dtype=float)
+    spreads = [(result[name + '_max'] - result[name + '_avg']).to_numpy(dtype=float) for name in HEIGHT_NEIGHBORHOODS]
+    second = np.select([spread > 1 for spread in spreads[:-1]], spreads[:-1], spreads[-1])
 
-        final_result.append((row['filename'], row['font'], row['class'], height))
+    return np.where(result['class'].to_numpy() == 1, first, second)
+
+
+def clamp_heights(severities, heights):
+    # fmin and fmax ignore NaN heights like the built-in min and max with 1.0 as first argument.
+    return np.where(severities == 1, np.fmin(1.0, heights), np.fmax(1.0, heights))
+
+
+def draw_plot(result):
+    severities = result['class'].to_numpy()
+    heights = compute_heights(result)
+    first, second = heights[severities == 1], heights[severities == 2]
+    heights = clamp_heights(severities, heights)
 
     print("Class LESS than 1 meter.")
-    print("Number of zeros   : {:05.2f} %".format(100 * sum(x == 0 for x in first) / len(first)))
-    print("Above 1 meter     : {:05.2f} %".format(100 * sum(x > 1.0 for x in first) / len(first)))
+    print("Number of zeros   : {:05.2f} %".format(100 * int((first == 0).sum()) / len(first)))
+    print("Above 1 meter     : {:05.2f} %".format(100 * int((first > 1.0).sum()) / len(first)))
 
     print("Class MORE than 1 meter.")
-    print("Above 3 meters    : {:05.2f} %".format(100 * sum(x > 3.0 for x in second) / len(second)))
-    print("Above 5 meters    : {:05.2f} %".format(100 * sum(x > 5.0 for x in second) / len(second)))
-    print("Less than 1 meter : {:05.2f} %".format(100 * sum(x < 1.0 and x != 0 for x in second) / len(second)))
-    print("Number of zeros   : {:05.2f} %".format(100 * sum(x == 0 for x in second) / len(second)))
+    print("Above 3 meters    : {:05.2f} %".format(100 * int((second > 3.0).sum()) / len(second)))
+    print("Above 5 meters    : {:05.2f} %".format(100 * int((second > 5.0).sum()) / len(second)))
+    print("Less than 1 meter : {:05.2f} %".format(100 * int(((second < 1.0) & (second != 0)).sum()) / len(second)))
+    print("Number of zeros   : {:05.2f} %".format(100 * int((second == 0).sum()) / len(second)))
+
+    # Matplotlib is only imported to draw, the heights are also computed without it.
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as mticker
 
     fig, ax = plt.subplots()
-    bp1 = ax.boxplot([t[3] for t in final_result if t[2] == 1], positions=[1], patch_artist=True, widths=[0.8])
-    bp2 = ax.boxplot([t[3] for t in final_result if t[2] == 2], positions=[2], patch_artist=True, widths=[0.8])
-    bp3 = ax.boxplot([t[3] for t in final_result if t[2] == 1 or t[2] == 2], positions=[3], patch_artist=True, widths=[0.8])
+    bp1 = ax.boxplot(heights[severities == 1], positions=[1], patch_artist=True, widths=[0.8])
+    bp2 = ax.boxplot(heights[severities == 2], positions=[2], patch_artist=True, widths=[0.8])
+    bp3 = ax.boxplot(heights, positions=[3], patch_artist=True, widths=[0.8])
 
     bp1['boxes'][0].set_facecolor("lightblue")
     bp2['boxes'][0].set_facecolor("lightgreen")
@@ -59,5 +84,6 @@ def draw_plot(result):
     fig.tight_layout()
     plt.savefig('heights.png')
 
-    df = pd.DataFrame(final_result, columns=['filename', 'font', 'class', 'height'])
+    df = pd.DataFrame({'filename': result['filename'].to_numpy(), 'font': result['font'].to_numpy(),
+                       'class': severities, 'height': heights})
     df.to_csv("result.csv", index=False)
@@ -0,0 +1,91 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import as_completed
+
+import requests
+from tqdm import tqdm
+
+from utils.dem_utils import DownloadError, get_mosaic_tiles, predict_quadrant, calculate_quadrant_positions, \
+    get_tile_store, get_tile_cache, get_executor, get_session, get_dsm_url, get_download_options, fetch_dsm
+from utils.vsimem_utils import vsimem_namespace
+
+
+def plan_tiles(data_frames):
+    # Photos of the same tile and quadrant need the same mosaic, so its tiles are only planned once.
+    tiles, planned = OrderedDict(), set()
+    for data_frame in data_frames:
+        for _, row in data_frame.iterrows():
+            quadrant = predict_quadrant(row)
+            key = (row['latitude_converted'], row['longitude_converted'], quadrant)
+            if key in planned:
+                continue
+
+            planned.add(key)
+            for tile in get_mosaic_tiles(row, calculate_quadrant_positions(quadrant)):
+                tiles[tile] = None
+    return list(tiles)
+
+
+def is_local(tile):
+    name = tile[0] + tile[1]
+    tile_store, tile_cache = get_tile_store(), get_tile_cache()
+    if tile_store is not None and os.path.isfile(tile_store.vrt_path(name)):
+        return True
+    return tile_cache is not None and (os.path.isfile(tile_cache.tile_path(name)) or tile_cache.is_missing(name))
+
+
+def prefetch_tile(tile):
+    # The tile is kept by the tile cache or the tile store, the copy in memory is dropped right away.
+    with vsimem_namespace() as prefix:
+        return fetch_dsm(tile[0], tile[1], prefix + "/dsm") is not None
+
+
+def request_tile_size(tile):
+    try:
+        response = get_session().head(get_dsm_url(tile[0], tile[1]), allow_redirects=True,
+                                      timeout=get_download_options()['timeout'])
+    except requests.RequestException as e:
+        raise DownloadError("Could not request tile {}{} ({}).".format(tile[0], tile[1], e))
+
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise DownloadError("Could not request tile {}{} (HTTP {}).".format(tile[0], tile[1], response.status_code))
+    return int(response.headers.get('Content-Length', 0))
+
+
+def map_tiles(function, tiles):
+    # The download executor bounds the number of concurrent requests.
+    futures = {get_executor().submit(function, tile): tile for tile in tiles}
+    results, errors = {}, {}
+    for future in tqdm(as_completed(futures), total=len(futures)):
+        try:
+            results[futures[future]] = future.result()
+        except RuntimeError as e:
+            errors[futures[future]] = e
+    return results, errors
+
+
+def prefetch_tiles(tiles, dry_run=False):
+    remote = [tile for tile in tiles if not is_local(tile)]
+    summary = {'tiles': len(tiles), 'local': len(tiles) - len(remote)}
+
+    if dry_run:
+        sizes, errors = map_tiles(request_tile_size, remote)
+        summary['missing'] = sum(1 for size in sizes.values() if size is None)
+        summary['to_download'] = len(sizes) - summary['missing']
+        summary['bytes'] = sum(size for size in sizes.values() if size is not None)
+    else:
+        fetched, errors = map_tiles(prefetch_tile, remote)
+        summary['missing'] = sum(1 for available in fetched.values() if not available)
+        summary['downloaded'] = len(fetched) - summary['missing']
+
+    summary['failed'] = len(errors)
+    for tile, error in errors.items():
+        print("{}{}: {}".format(tile[0], tile[1], error))
+    return summary
+
+
+def print_prefetch_summary(summary):
+    for name, value in summary.items():
+        print("{:<20}: {:>10d}".format(name, value))
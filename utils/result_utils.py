@@ -0,0 +1,92 @@
+import csv
+import os
+import time
+
+import pandas as pd
+
+from utils.trace_utils import stage
+
+
+def truncate_partial_line(path):
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+
+        # A crash in the middle of a write leaves an incomplete last row, which is dropped and recomputed.
+        position = size
+        while position > 0:
+            chunk_start = max(position - 4096, 0)
+            f.seek(chunk_start)
+            chunk = f.read(position - chunk_start)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                f.truncate(chunk_start + newline + 1)
+                return
+            position = chunk_start
+        f.truncate(0)
+
+
+class ResultWriter:
+
+    def __init__(self, output_name, columns, batch_size=50, fsync_interval=10.0, parquet_name=None):
+        self.output_name = output_name
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.parquet_name = parquet_name
+        self.buffer = []
+        self.done = set()
+
+        if os.path.isfile(output_name):
+            truncate_partial_line(output_name)
+
+        if os.path.isfile(output_name) and os.path.getsize(output_name) > 0:
+            with open(output_name, newline="") as f:
+                self.columns = next(csv.reader(f))
+            self.done = set(pd.read_csv(output_name, usecols=['filename'], dtype=str)['filename'])
+            self.file = open(output_name, "a", newline="")
+            self.writer = csv.DictWriter(self.file, fieldnames=self.columns)
+        else:
+            self.columns = columns
+            self.file = open(output_name, "w", newline="")
+            self.writer = csv.DictWriter(self.file, fieldnames=self.columns)
+            self.writer.writeheader()
+
+        self.last_fsync = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, result):
+        self.buffer.append(result)
+        self.done.add(str(result['filename']))
+
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self, sync=False):
+        with stage("write"):
+            self.writer.writerows(self.buffer)
+            self.buffer = []
+            self.file.flush()
+
+            if sync or time.monotonic() - self.last_fsync >= self.fsync_interval:
+                os.fsync(self.file.fileno())
+                self.last_fsync = time.monotonic()
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        self.flush(sync=True)
+        self.file.close()
+
+        if self.parquet_name is not None:
+            pd.read_csv(self.output_name).to_parquet(self.parquet_name, index=False)
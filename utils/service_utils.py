@@ -0,0 +1,60 @@
+import json
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class EstimationRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {'status': "ok"})
+        else:
+            self.send_json(404, {'error': "Unknown path {}.".format(self.path)})
+
+    def do_POST(self):
+        if self.path != "/estimate":
+            self.send_json(404, {'error': "Unknown path {}.".format(self.path)})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            self.send_json(400, {'error': "The request body is not valid JSON."})
+            return
+
+        # A single photo is answered with a single result, a list of photos with a list of results.
+        photos = request if isinstance(request, list) else [request]
+        if not all(isinstance(photo, dict) for photo in photos):
+            self.send_json(400, {'error': "Photos should be JSON objects with a latitude and a longitude."})
+            return
+
+        try:
+            results = self.server.estimate(photos)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+
+        self.send_json(200, results if isinstance(request, list) else results[0])
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class EstimationServer(ThreadingHTTPServer):
+
+    def __init__(self, address, estimate):
+        super().__init__(address, EstimationRequestHandler)
+        self.estimate = estimate
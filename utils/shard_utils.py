@@ -0,0 +1,48 @@
+import glob
+import zlib
+from pathlib import Path
+
+import pandas as pd
+
+
+def parse_shard(shard):
+    try:
+        index, count = (int(value) for value in shard.split("/"))
+    except ValueError:
+        raise ValueError("Shard should be given as i/N, got {}.".format(shard))
+
+    if count < 1:
+        raise ValueError("Shard count should be positive, got {}.".format(count))
+    if not 0 <= index < count:
+        raise ValueError("Shard index should be in [0, {}), got {}.".format(count, index))
+    return index, count
+
+
+def tile_shard(latitude, longitude, count):
+    # crc32 is stable across machines and Python runs, unlike hash() of a string.
+    return zlib.crc32("{}{}".format(latitude, longitude).encode("utf-8")) % count
+
+
+def select_shard(data_frame, shard):
+    index, count = shard
+    shards = [tile_shard(latitude, longitude, count)
+              for latitude, longitude in zip(data_frame['latitude_converted'], data_frame['longitude_converted'])]
+    return data_frame[pd.Series(shards, index=data_frame.index, dtype=int) == index]
+
+
+def get_shard_output_name(output_name, shard):
+    output_path = Path(output_name)
+    return str(output_path.with_name("{}.shard-{}-of-{}{}".format(output_path.stem, shard[0], shard[1],
+                                                                 output_path.suffix)))
+
+
+def merge_shard_outputs(output_name):
+    output_path = Path(output_name)
+    shard_names = sorted(glob.glob(str(output_path.with_name("{}.shard-*-of-*{}".format(output_path.stem,
+                                                                                      output_path.suffix)))))
+    if not shard_names:
+        raise FileNotFoundError("No shard outputs of {} were found.".format(output_name))
+
+    result_df = pd.concat([pd.read_csv(shard_name, dtype={'filename': str}) for shard_name in shard_names],
+                          ignore_index=True)
+    return result_df.drop_duplicates('filename').reset_index(drop=True)
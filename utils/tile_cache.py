@@ -0,0 +1,100 @@
+import os
+import tempfile
+import time
+
+from utils.trace_utils import count
+
+
+class TileCache:
+
+    def __init__(self, directory, max_bytes=None, missing_ttl=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.missing_ttl = missing_ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def tile_path(self, name):
+        return os.path.join(self.directory, "{}_AVE_DSM.tif".format(name))
+
+    def missing_path(self, name):
+        return os.path.join(self.directory, "{}.missing".format(name))
+
+    def tiles(self):
+        return {entry.name[:-len("_AVE_DSM.tif")]: entry.path for entry in os.scandir(self.directory)
+                if entry.name.endswith("_AVE_DSM.tif")}
+
+    def is_missing(self, name):
+        try:
+            modified = os.stat(self.missing_path(name)).st_mtime
+        except FileNotFoundError:
+            return False
+
+        return self.missing_ttl is None or time.time() - modified <= self.missing_ttl
+
+    def lookup(self, name):
+        path = self.tile_path(name)
+        try:
+            # The modification time doubles as the last access time for the LRU eviction.
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, name, fetch):
+        path = self.lookup(name)
+        if path is not None:
+            count("tile_cache_hits")
+            return path
+
+        if self.is_missing(name):
+            count("tile_cache_missing_hits")
+            return None
+
+        count("tile_cache_misses")
+        content = fetch()
+        if content is None:
+            self.write(self.missing_path(name), b"")
+            return None
+
+        path = self.tile_path(name)
+        self.write(path, content)
+        self.evict(keep=path)
+        return path
+
+    def write(self, path, content):
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    def evict(self, keep=None):
+        if self.max_bytes is None:
+            return
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tif"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
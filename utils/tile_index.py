@@ -0,0 +1,45 @@
+import os
+
+import gdal
+import gdalconst
+
+from utils.dem_utils import get_tile_origin, shift_tile, get_points_window, clip_dsm
+from utils.trace_utils import stage
+
+
+class TileIndex:
+
+    def __init__(self, path, sources):
+        self.path = os.path.abspath(path)
+        self.names = set(sources)
+        self.datasets = {}
+
+        paths = [os.path.abspath(sources[name]) for name in sorted(sources)]
+
+        # The tiles along the antimeridian are also indexed on the other side of it, so windows of photos close to
+        # it are read across the edge instead of being cut.
+        base = os.path.splitext(self.path)[0]
+        for name in sorted(sources):
+            x_origin, _ = get_tile_origin(name[:4], name[4:])
+            if x_origin == -180 or x_origin == 179:
+                offset = 360 if x_origin == -180 else -360
+                paths.append(shift_tile(os.path.abspath(sources[name]), offset,
+                                        "{}_{}_wrapped.vrt".format(base, name)))
+
+        with stage("index"):
+            gdal.BuildVRT(self.path, paths, VRTNodata=-9999)
+
+    def __getstate__(self):
+        # Datasets are not shared with worker processes, each one opens the index again.
+        return {'path': self.path, 'names': self.names, 'datasets': {}}
+
+    def open(self):
+        key = os.getpid()
+        if key not in self.datasets:
+            self.datasets[key] = gdal.Open(self.path, gdalconst.GA_ReadOnly)
+        return self.datasets[key]
+
+    def read(self, rows, filename):
+        dataset = self.open()
+        window = get_points_window(dataset, [(row['longitude'], row['latitude']) for row in rows])
+        return clip_dsm(dataset, filename, window)
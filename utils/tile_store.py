@@ -0,0 +1,90 @@
+import glob
+import os
+import threading
+from xml.sax.saxutils import escape
+
+import gdal
+import gdalconst
+import numpy as np
+
+from utils.trace_utils import count
+
+STORE_DTYPE = np.dtype("<f4")
+
+VRT_TEMPLATE = """<VRTDataset rasterXSize="{cols}" rasterYSize="{rows}">
+  <SRS>{projection}</SRS>
+  <GeoTransform>{geotransform}</GeoTransform>
+  <VRTRasterBand dataType="Float32" band="1" subClass="VRTRawRasterBand">
+{nodata}    <SourceFilename relativeToVRT="1">{raw_name}</SourceFilename>
+    <ImageOffset>0</ImageOffset>
+    <PixelOffset>{pixel_offset}</PixelOffset>
+    <LineOffset>{line_offset}</LineOffset>
+    <ByteOrder>LSB</ByteOrder>
+  </VRTRasterBand>
+</VRTDataset>
+"""
+
+
+class TileStore:
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def raw_path(self, name):
+        return os.path.join(self.directory, "{}_AVE_DSM.f32".format(name))
+
+    def vrt_path(self, name):
+        return os.path.join(self.directory, "{}_AVE_DSM.vrt".format(name))
+
+    def tiles(self):
+        return {entry.name[:-len("_AVE_DSM.vrt")]: entry.path for entry in os.scandir(self.directory)
+                if entry.name.endswith("_AVE_DSM.vrt")}
+
+    def lookup(self, name):
+        # The VRT is written last, so a tile is only visible once it was completely imported.
+        path = self.vrt_path(name)
+        if not os.path.isfile(path):
+            return None
+
+        count("tile_store_hits")
+        return path
+
+    def import_tile(self, name, source_path):
+        dataset = gdal.Open(source_path, gdalconst.GA_ReadOnly)
+        band = dataset.GetRasterBand(1)
+        rows, cols, nodata = dataset.RasterYSize, dataset.RasterXSize, band.GetNoDataValue()
+
+        raw_path = self.raw_path(name)
+        temporary_path = "{}.{}.{}.tmp".format(raw_path, os.getpid(), threading.get_ident())
+        raw = np.memmap(temporary_path, dtype=STORE_DTYPE, mode="w+", shape=(rows, cols))
+        for row_start in range(0, rows, 1024):
+            block_rows = min(1024, rows - row_start)
+            raw[row_start:row_start + block_rows] = band.ReadAsArray(0, row_start, cols, block_rows)
+        raw.flush()
+        del raw
+        os.replace(temporary_path, raw_path)
+
+        self.write_text(self.vrt_path(name), VRT_TEMPLATE.format(
+            cols=cols, rows=rows, projection=escape(dataset.GetProjection()),
+            geotransform=", ".join(repr(value) for value in dataset.GetGeoTransform()),
+            nodata="" if nodata is None else "    <NoDataValue>{}</NoDataValue>\n".format(nodata),
+            raw_name=os.path.basename(raw_path), pixel_offset=STORE_DTYPE.itemsize,
+            line_offset=STORE_DTYPE.itemsize * cols))
+
+    def import_directory(self, source_directory, overwrite=False):
+        imported = 0
+        for source_path in sorted(glob.glob(os.path.join(source_directory, "**", "*_AVE_DSM.tif"), recursive=True)):
+            name = os.path.basename(source_path)[:-len("_AVE_DSM.tif")]
+            if not overwrite and os.path.isfile(self.vrt_path(name)):
+                continue
+
+            self.import_tile(name, source_path)
+            imported += 1
+        return imported
+
+    def write_text(self, path, content):
+        temporary_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(temporary_path, "w") as f:
+            f.write(content)
+        os.replace(temporary_path, path)
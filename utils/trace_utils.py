@@ -0,0 +1,112 @@
+import json
+import time
+from collections import defaultdict
+
+_tracer = None
+
+
+class Stage:
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.timers[self.name] += time.perf_counter() - self.start
+        tag_stage(exc_value, self.name)
+
+
+class NullStage:
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        tag_stage(exc_value, self.name)
+
+
+def tag_stage(exception, name):
+    # The innermost stage an exception goes through is the one it was raised in.
+    if exception is not None and getattr(exception, "stage", None) is None:
+        try:
+            exception.stage = name
+        except AttributeError:
+            pass
+
+
+class Tracer:
+
+    def __init__(self, trace_path=None):
+        self.trace_file = open(trace_path, "a") if trace_path else None
+        self.timers, self.counters = defaultdict(float), defaultdict(int)
+        self.total_timers, self.total_counters = defaultdict(float), defaultdict(int)
+        self.units, self.rows, self.failed_rows = 0, 0, 0
+        self.records = []
+        self.start = time.perf_counter()
+
+    def finish_unit(self, filenames, failed, seconds):
+        record = {'filenames': filenames, 'failed': failed, 'seconds': seconds, 'timers': dict(self.timers),
+                  'counters': dict(self.counters)}
+        self.timers, self.counters = defaultdict(float), defaultdict(int)
+        self.add_record(record)
+
+    def add_record(self, record):
+        self.units += 1
+        self.rows += len(record['filenames'])
+        self.failed_rows += len(record['failed'])
+        for name, seconds in record['timers'].items():
+            self.total_timers[name] += seconds
+        for name, value in record['counters'].items():
+            self.total_counters[name] += value
+
+        if self.trace_file is not None:
+            self.trace_file.write(json.dumps(record) + "\n")
+        else:
+            self.records.append(record)
+
+    def pop_records(self):
+        records, self.records = self.records, []
+        return records
+
+    def summary(self):
+        return {'seconds': time.perf_counter() - self.start, 'units': self.units, 'rows': self.rows,
+                'failed_rows': self.failed_rows, 'timers': dict(self.total_timers),
+                'counters': dict(self.total_counters)}
+
+    def close(self):
+        if self.trace_file is not None:
+            self.trace_file.close()
+
+
+def get_tracer():
+    return _tracer
+
+
+def set_tracer(tracer):
+    global _tracer
+    _tracer = tracer
+
+
+def stage(name):
+    return NullStage(name) if _tracer is None else Stage(_tracer, name)
+
+
+def count(name, value=1):
+    if _tracer is not None:
+        _tracer.counters[name] += value
+
+
+def print_summary(summary):
+    print("Processed {} photos ({} failed) in {:.2f} s.".format(summary['rows'], summary['failed_rows'],
+                                                              summary['seconds']))
+    for name, seconds in sorted(summary['timers'].items(), key=lambda item: -item[1]):
+        print("{:<20}: {:10.2f} s".format(name, seconds))
+    for name, value in sorted(summary['counters'].items()):
+        print("{:<20}: {:10d}".format(name, value))
@@ -0,0 +1,29 @@
+import os
+import uuid
+from contextlib import contextmanager
+
+import gdal
+
+from utils.trace_utils import get_tracer, count
+
+
+def create_namespace():
+    return "/vsimem/{}_{}".format(os.getpid(), uuid.uuid4().hex)
+
+
+def remove_namespace(prefix):
+    for name in gdal.ReadDirRecursive(prefix) or []:
+        if not name.endswith("/"):
+            path = "{}/{}".format(prefix, name)
+            if get_tracer() is not None:
+                count("vsimem_bytes", gdal.VSIStatL(path).size)
+            gdal.Unlink(path)
+
+
+@contextmanager
+def vsimem_namespace():
+    prefix = create_namespace()
+    try:
+        yield prefix
+    finally:
+        remove_namespace(prefix)